@@ -0,0 +1,37 @@
+import time
+
+from circuits import nand_ripple_adder
+
+# Straight-line code generation must stay linear in the gate count: if the
+# generated source per gate grows with N, shared subexpressions are being
+# inlined again.
+MAX_SOURCE_PER_GATE = 80
+
+
+def main():
+    print(f"{'bits':>5} {'gates':>6} {'source':>8} {'per gate':>9} {'compile ms':>11} {'eval ms':>9}")
+    failed = False
+    for n_bits in (2, 4, 8, 16, 32, 64, 128):
+        level = nand_ripple_adder(n_bits)
+
+        start = time.perf_counter()
+        level.compile()
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        eval_ms = float("nan")
+        if 2 * n_bits <= 16:
+            start = time.perf_counter()
+            assert level.evaluate(), f"{n_bits}-bit adder failed at {level.first_failure}"
+            eval_ms = (time.perf_counter() - start) * 1000
+
+        source = len(level.current_function.source)
+        per_gate = source / len(level.gates)
+        failed |= per_gate > MAX_SOURCE_PER_GATE
+        print(f"{n_bits:>5} {len(level.gates):>6} {source:>8} {per_gate:>9.1f} {compile_ms:>11.2f} {eval_ms:>9.2f}")
+
+    if failed:
+        raise SystemExit(f"generated source exceeded {MAX_SOURCE_PER_GATE} characters per gate")
+
+
+if __name__ == "__main__":
+    main()
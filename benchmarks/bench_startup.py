@@ -0,0 +1,53 @@
+import os, sys, json, statistics, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each probe runs in a fresh interpreter so module caches do not hide the cost
+PROBES = {
+    "import logic": """
+import time
+start = time.perf_counter()
+import logic
+elapsed = time.perf_counter() - start
+import sys
+result = {"seconds": elapsed, "pygame_loaded": "pygame.display" in sys.modules}
+""",
+    "import main": """
+import time
+start = time.perf_counter()
+import main
+result = {"seconds": time.perf_counter() - start}
+""",
+    "first frame": """
+import time
+start = time.perf_counter()
+import pygame
+import main
+main.init_display()
+level = main.levels[0]
+main.draw_background(main.screen, main.background_color)
+level.draw(main.screen, main.WIDTH, main.HEIGHT, (0, 0))
+pygame.display.flip()
+result = {"seconds": time.perf_counter() - start}
+""",
+}
+
+
+def run_probe(code):
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    script = code + "\nimport json\nprint(json.dumps(result))\n"
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(repeats=5):
+    print(f"{'probe':<14} {'median ms':>10} {'min ms':>8}  notes")
+    for name, code in PROBES.items():
+        results = [run_probe(code) for _ in range(repeats)]
+        times = [r["seconds"] * 1000 for r in results]
+        notes = "pygame loaded" if any(r.get("pygame_loaded") for r in results) else ""
+        print(f"{name:<14} {statistics.median(times):>10.1f} {min(times):>8.1f}  {notes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import os, json, time, platform, argparse, statistics
+
+# Headless: a dummy video driver and no pygame banner on stdout
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+# logic resolves gate image paths against the working directory on import
+START_DIR = os.getcwd()
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuits import half_adder_ripple_adder, nand_tree, random_dag
+import logic
+from ui import Button, draw_background, get_font
+
+# Every benchmark is timed as the median of REPEATS runs of a batch sized to
+# take about BATCH_SECONDS, after one warm-up call. Results are keyed
+# "<benchmark>/<circuit>" and compared by median against the baseline.
+REPEATS = 7
+BATCH_SECONDS = 0.05
+SCREEN_SIZE = (1280, 720)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Truth-table work grows with 2**inputs; larger circuits skip it
+MAX_TABLE_INPUTS = 16
+
+CIRCUITS = {
+    "full": [("adder", n, half_adder_ripple_adder) for n in (2, 4, 8, 16, 32)]
+            + [("nand_tree", d, nand_tree) for d in (3, 4, 6, 8, 10)]
+            + [("random_dag", n, random_dag) for n in (100, 1000, 10000)],
+    "quick": [("adder", n, half_adder_ripple_adder) for n in (2, 8)]
+             + [("nand_tree", d, nand_tree) for d in (4, 8)]
+             + [("random_dag", n, random_dag) for n in (100, 1000)],
+}
+
+
+def measure(func):
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= BATCH_SECONDS or number >= 1 << 16:
+            break
+        number *= 2
+    runs = [elapsed / number]
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+    return {"median_ms": statistics.median(runs) * 1000, "min_ms": min(runs) * 1000, "calls": number * REPEATS}
+
+
+def cold_compile(level):
+    # Drops the compile cache and the structural hashes, so every call pays
+    # for hashing and code generation like the first compile of a circuit
+    logic._compile_cache.clear()
+    level.node_hash.clear()
+    level.dirty_outputs = set(range(len(level.outputs)))
+    level.compile()
+
+
+def flip_input(level):
+    level.set_input(0, not level.inputs[0].value)
+
+
+def circuit_benchmarks(level, screen):
+    width, height = screen.get_size()
+    mouse = (width // 2, height // 2)
+    benches = {
+        "compile": lambda: cold_compile(level),
+        "compile_cached": level.compile,
+        "draw": lambda: level.draw(screen, width, height, mouse),
+        # A value change repaints the wire layer and the gates it reaches
+        "draw_after_input": lambda: (flip_input(level), level.draw(screen, width, height, mouse)),
+    }
+    if len(level.inputs) <= MAX_TABLE_INPUTS:
+        benches["evaluate"] = level.evaluate
+
+        def first_table():
+            level.truth_table_surface = None
+            level.packed_actual = None
+            level.draw_truth_table(screen, width, height)
+        benches["truth_table"] = first_table
+        benches["truth_table_cached"] = lambda: level.draw_truth_table(screen, width, height)
+    return benches
+
+
+def screen_benchmarks(screen):
+    button = Button("Jogar", get_font('arial', int(screen.get_height() * 0.04)), 640, 360, 20, (40, 40, 40), (50, 200, 50))
+    offsets = iter(range(1 << 30))
+    return {
+        "draw_background": lambda: draw_background(screen, (80, 80, 80), next(offsets)),
+        "button_draw": lambda: button.draw(screen, False, (50, 200, 50), (25, 25, 25)),
+        "button_draw_hover": lambda: button.draw(screen, True, (50, 200, 50), (25, 25, 25), (0, 3)),
+    }
+
+
+def run(suite, only=None):
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    results = {}
+
+    def record(name, func, **info):
+        if only and only not in name:
+            return
+        result = measure(func)
+        result.update(info)
+        results[name] = result
+        print(f"{name:<40} {result['median_ms']:>10.3f} {result['min_ms']:>10.3f}", flush=True)
+
+    print(f"{'benchmark':<40} {'median ms':>10} {'min ms':>10}")
+    for name, func in screen_benchmarks(screen).items():
+        record(f"{name}/screen", func)
+    for family, size, build in CIRCUITS[suite]:
+        level = build(size)
+        level.compile()
+        info = {"gates": len(level.gates), "wires": len(level.wires), "inputs": len(level.inputs)}
+        for name, func in circuit_benchmarks(level, screen).items():
+            record(f"{name}/{family}-{size}", func, **info)
+    pygame.quit()
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Ratio of medians per benchmark present in both; above 1 + threshold is
+    # a regression, below 1 / (1 + threshold) an improvement
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            print(f"{name:<40} {'-':>10} {result['median_ms']:>10.3f} {'new':>7}")
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  slower"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            mark = "  faster"
+        print(f"{name:<40} {old['median_ms']:>10.3f} {result['median_ms']:>10.3f} {ratio:>7.2f}{mark}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time compile, evaluate and rendering on generated circuits, headless.")
+    parser.add_argument("--suite", choices=sorted(CIRCUITS), default="full", help="circuit sizes to run (default: full)")
+    parser.add_argument("-k", dest="only", help="only run benchmarks whose name contains this")
+    parser.add_argument("-o", "--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON results to compare against (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression (default: 0.25)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 when anything regressed")
+    args = parser.parse_args(argv)
+    # Relative to where the script was started, not the repository root
+    output = os.path.join(START_DIR, args.output) if args.output else None
+    baseline_path = os.path.join(START_DIR, args.baseline)
+    # Checked up front: without a baseline there is nothing to compare, and a
+    # run that compares nothing must not pass for a clean one
+    if not args.save_baseline and not os.path.exists(baseline_path):
+        raise SystemExit(f"no baseline at {baseline_path}; run with --save-baseline to record one")
+
+    report = {
+        "meta": {
+            "suite": args.suite,
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": run(args.suite, args.only),
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"\nbaseline written to {baseline_path}")
+        return
+    with open(baseline_path, encoding="utf-8") as f:
+        regressions = compare(report["results"], json.load(f), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from logic import Gate, Wire, Level
+
+
+def adder_function(n_bits):
+    # Inputs are a[0..n-1] followed by b[0..n-1], least significant bit first
+    def function(inputs):
+        a = sum(1 << i for i in range(n_bits) if inputs[i])
+        b = sum(1 << i for i in range(n_bits) if inputs[n_bits + i])
+        total = a + b
+        return [bool((total >> i) & 1) for i in range(n_bits + 1)]
+    return function
+
+
+def nand_ripple_adder(n_bits):
+    # Each full adder is the classic 9-NAND construction; carries and the
+    # a^b intermediate fan out to several NANDs, so the circuit is full of
+    # reconvergent paths.
+    level = Level(f"NAND ADDER {n_bits}", 2 * n_bits, {"NAND": -1}, adder_function(n_bits))
+
+    def nand(src_a, src_b):
+        gate = Gate("NAND", 2, 1, (0, 0))
+        level.add_gate(gate)
+        level.add_wire(Wire(src_a, (gate.id, "GATE_I", 0)))
+        level.add_wire(Wire(src_b, (gate.id, "GATE_I", 1)))
+        return (gate.id, "GATE_O", 0)
+
+    carry = None
+    for i in range(n_bits):
+        a = (i, "TERMINAL_I", 0)
+        b = (n_bits + i, "TERMINAL_I", 0)
+        n1 = nand(a, b)
+        half = nand(nand(a, n1), nand(b, n1))
+        if carry is None:
+            level.add_wire(Wire(half, (i, "TERMINAL_O", 0)))
+            carry = nand(n1, n1)
+            continue
+        n4 = nand(half, carry)
+        level.add_wire(Wire(nand(nand(half, n4), nand(carry, n4)), (i, "TERMINAL_O", 0)))
+        carry = nand(n4, n1)
+    level.add_wire(Wire(carry, (n_bits, "TERMINAL_O", 0)))
+    return level
+
+
+def half_adder_ripple_adder(n_bits):
+    # Each full adder is two HALF ADDER gates (the custom gate from levels)
+    # with an OR joining their carries
+    from levels import logic_gates
+    level = Level(f"HALF ADDER ADDER {n_bits}", 2 * n_bits, {"HALF ADDER": -1, "OR": -1}, adder_function(n_bits))
+
+    def place(gate_type, *sources):
+        gate = logic_gates[gate_type].copy()
+        level.add_gate(gate)
+        for pin, src in enumerate(sources):
+            level.add_wire(Wire(src, (gate.id, "GATE_I", pin)))
+        return gate.id
+
+    carry = None
+    for i in range(n_bits):
+        first = place("HALF ADDER", (i, "TERMINAL_I", 0), (n_bits + i, "TERMINAL_I", 0))
+        if carry is None:
+            level.add_wire(Wire((first, "GATE_O", 0), (i, "TERMINAL_O", 0)))
+            carry = (first, "GATE_O", 1)
+            continue
+        second = place("HALF ADDER", (first, "GATE_O", 0), carry)
+        level.add_wire(Wire((second, "GATE_O", 0), (i, "TERMINAL_O", 0)))
+        carry = (place("OR", (first, "GATE_O", 1), (second, "GATE_O", 1)), "GATE_O", 0)
+    level.add_wire(Wire(carry, (n_bits, "TERMINAL_O", 0)))
+    return layout(level)
+
+
+def nand_tree(depth):
+    # Balanced tree of NANDs over 2**depth inputs, one output
+    def function(inputs):
+        values = list(inputs)
+        while len(values) > 1:
+            values = [not (values[i] and values[i + 1]) for i in range(0, len(values), 2)]
+        return values
+    level = Level(f"NAND TREE {depth}", 1 << depth, {"NAND": -1}, function)
+
+    sources = [(i, "TERMINAL_I", 0) for i in range(1 << depth)]
+    while len(sources) > 1:
+        next_sources = []
+        for i in range(0, len(sources), 2):
+            gate = Gate("NAND", 2, 1, (0, 0))
+            level.add_gate(gate)
+            level.add_wire(Wire(sources[i], (gate.id, "GATE_I", 0)))
+            level.add_wire(Wire(sources[i + 1], (gate.id, "GATE_I", 1)))
+            next_sources.append((gate.id, "GATE_O", 0))
+        sources = next_sources
+    level.add_wire(Wire(sources[0], (0, "TERMINAL_O", 0)))
+    return layout(level)
+
+
+def random_dag(n_gates, n_inputs=8, n_outputs=4, seed=0):
+    # Built-in gates wired to random earlier sources; the expected function is
+    # all False, so evaluate() does the full check and reports a mismatch
+    import random
+    rnd = random.Random(seed)
+    level = Level(f"RANDOM DAG {n_gates}", n_inputs, {}, lambda inputs: [False] * n_outputs)
+    gate_types = [("AND", 2), ("OR", 2), ("NOT", 1), ("XOR", 2), ("NAND", 2), ("NOR", 2), ("XNOR", 2)]
+    sources = [(i, "TERMINAL_I", 0) for i in range(n_inputs)]
+    for _ in range(n_gates):
+        gate_type, n_in = rnd.choice(gate_types)
+        gate = Gate(gate_type, n_in, 1, (0, 0))
+        level.add_gate(gate)
+        # Mostly local fan-in, like a hand-built circuit, with some long wires
+        for pin in range(n_in):
+            src = rnd.choice(sources[-32:]) if rnd.random() < 0.9 else rnd.choice(sources)
+            level.add_wire(Wire(src, (gate.id, "GATE_I", pin)))
+        sources.append((gate.id, "GATE_O", 0))
+    for i in range(n_outputs):
+        level.add_wire(Wire(sources[-1 - i], (i, "TERMINAL_O", 0)))
+    return layout(level)
+
+
+def layout(level, spacing=80):
+    # Columns by logic depth, left to right from the input terminals, so the
+    # render benchmarks draw something shaped like a real circuit
+    depth = {}
+    column_sizes = {}
+    for gid in level.levelize():
+        sources = (level.drivers.get((gid, "GATE_I", i)) for i in range(len(level.gates[gid].inputs)))
+        depth[gid] = 1 + max((depth.get(src[0], 0) for src in sources if src and src[1] == "GATE_O"), default=0)
+        row = column_sizes.get(depth[gid], 0)
+        column_sizes[depth[gid]] = row + 1
+        level.move_gate(level.gates[gid], (150 + depth[gid] * spacing, 80 + row * spacing))
+    return level
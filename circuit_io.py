@@ -0,0 +1,307 @@
+import sys, gc, json, struct
+from array import array
+from contextlib import contextmanager
+
+from logic import Wire
+from levels import logic_gates
+from netlist import Netlist
+
+# Versioned on-disk circuit format. Files ending in .json hold the readable
+# encoding, anything else the compact binary one:
+#
+#   header   "<4sBHII"  magic, version, type count, gate count, wire count
+#   types    per gate type: u8 length + UTF-8 name (gate type codes index this)
+#   level    u16 length + UTF-8 level name
+#   gates    ids u32[n], type codes u16[n], positions i32[2n]
+#   wires    from ids u32, from kinds u8, from pins u16,
+#            to ids u32, to kinds u8, to pins u16, each [m]
+#
+# All integers are little-endian.
+
+FORMAT_NAME = "logic-gates-circuit"
+FORMAT_VERSION = 1
+MAGIC = b"LGC1"
+HEADER = struct.Struct("<4sBHII")
+ENDPOINT_KINDS = ("TERMINAL_I", "TERMINAL_O", "GATE_I", "GATE_O")
+_kind_codes = {kind: code for code, kind in enumerate(ENDPOINT_KINDS)}
+
+
+@contextmanager
+def _gc_paused():
+    # Loading allocates hundreds of thousands of small objects that are never
+    # garbage; without this the cyclic collector runs over them repeatedly.
+    # They are frozen on the way out so re-enabling it doesn't trigger one
+    # full pass over all of them either.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.freeze()
+            gc.enable()
+
+
+def new_gate(gate_type, gate_id, position):
+    if gate_type not in logic_gates:
+        raise ValueError(f"Unknown gate type '{gate_type}' in circuit file")
+    return logic_gates[gate_type].placed(gate_id, position)
+
+
+def check_wires(level, gates, wires):
+    # Same rules as the wiring UI: wires run from a source to a sink, and
+    # each sink takes a single wire
+    n_inputs, n_outputs = len(level.inputs), len(level.outputs)
+    sinks = set()
+    for wire in wires:
+        src, dst = wire.from_i, wire.to_i
+        if src[1] == "GATE_O":
+            gate = gates.get(src[0])
+            valid = gate is not None and 0 <= src[2] < len(gate.outputs)
+        elif src[1] == "TERMINAL_I":
+            valid = 0 <= src[0] < n_inputs
+        else:
+            raise ValueError(f"Wire {tuple(src)} -> {tuple(dst)} does not run from a source to a sink")
+        if not valid:
+            raise ValueError(f"Wire endpoint {tuple(src)} does not exist in level '{level.name}'")
+        if dst[1] == "GATE_I":
+            gate = gates.get(dst[0])
+            valid = gate is not None and 0 <= dst[2] < len(gate.inputs)
+        elif dst[1] == "TERMINAL_O":
+            valid = 0 <= dst[0] < n_outputs
+        else:
+            raise ValueError(f"Wire {tuple(src)} -> {tuple(dst)} does not run from a source to a sink")
+        if not valid:
+            raise ValueError(f"Wire endpoint {tuple(dst)} does not exist in level '{level.name}'")
+        if dst in sinks:
+            raise ValueError(f"Wire endpoint {tuple(dst)} has more than one driver")
+        sinks.add(dst)
+
+
+def circuit_to_dict(level):
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "level": level.name,
+        "gates": [{"id": gate.id, "type": gate.type, "position": list(gate.position)} for gate in level.gates.values()],
+        "wires": [[list(wire.from_i), list(wire.to_i)] for wire in level.wires],
+    }
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _json_list(data, key):
+    value = data.get(key, [])
+    if not isinstance(value, list):
+        raise ValueError(f"'{key}' in circuit file must be a list")
+    return value
+
+
+def _json_position(value):
+    if not (isinstance(value, list) and len(value) == 2
+            and all(_is_int(c) or isinstance(c, float) for c in value)):
+        raise ValueError(f"Invalid gate position {value!r} in circuit file")
+    return tuple(value)
+
+
+def _json_endpoint(value):
+    if not (isinstance(value, list) and len(value) == 3
+            and _is_int(value[0]) and value[1] in ENDPOINT_KINDS and _is_int(value[2])):
+        raise ValueError(f"Invalid wire endpoint {value!r} in circuit file")
+    return tuple(value)
+
+
+def _json_rows(data):
+    # (id, type, position) gate rows and (from_i, to_i) wire rows of a JSON
+    # circuit. Anything malformed raises ValueError, so a hand-edited save
+    # can be rejected without crashing the game
+    if not isinstance(data, dict):
+        raise ValueError("Circuit file must hold a JSON object")
+    version = data.get("version", FORMAT_VERSION)
+    if not _is_int(version):
+        raise ValueError(f"Invalid circuit format version {version!r}")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Circuit format version {version} is newer than supported ({FORMAT_VERSION})")
+    gates = []
+    seen = set()
+    for spec in _json_list(data, "gates"):
+        if not (isinstance(spec, dict) and _is_int(spec.get("id")) and isinstance(spec.get("type"), str)):
+            raise ValueError(f"Invalid gate {spec!r} in circuit file")
+        if spec["id"] in seen:
+            raise ValueError(f"Duplicate gate id {spec['id']} in circuit file")
+        seen.add(spec["id"])
+        gates.append((spec["id"], spec["type"].upper(), _json_position(spec.get("position", [0, 0]))))
+    wires = []
+    for entry in _json_list(data, "wires"):
+        if not (isinstance(entry, list) and len(entry) == 2):
+            raise ValueError(f"Invalid wire {entry!r} in circuit file")
+        wires.append((_json_endpoint(entry[0]), _json_endpoint(entry[1])))
+    return gates, wires
+
+
+def _parse_dict(level, data):
+    gate_rows, wire_rows = _json_rows(data)
+    gates = {gate_id: new_gate(gate_type, gate_id, position) for gate_id, gate_type, position in gate_rows}
+    wires = [Wire(from_i, to_i) for from_i, to_i in wire_rows]
+    check_wires(level, gates, wires)
+    return gates, wires
+
+
+def circuit_from_dict(level, data):
+    level.load_circuit(*_parse_dict(level, data))
+
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _read_array(typecode, data, offset, count):
+    arr = array(typecode)
+    end = offset + arr.itemsize * count
+    if end > len(data):
+        raise ValueError("Circuit file is truncated")
+    arr.frombytes(data[offset:end])
+    return _little_endian(arr), end
+
+
+def _read_string(data, offset, length_format):
+    if offset + struct.calcsize(length_format) > len(data):
+        raise ValueError("Circuit file is truncated")
+    (length,) = struct.unpack_from(length_format, data, offset)
+    offset += struct.calcsize(length_format)
+    if offset + length > len(data):
+        raise ValueError("Circuit file is truncated")
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+
+def encode_binary(level):
+    type_names = sorted({gate.type for gate in level.gates.values()})
+    type_codes = {name: code for code, name in enumerate(type_names)}
+    gates = list(level.gates.values())
+
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, len(type_names), len(gates), len(level.wires))]
+    for name in type_names:
+        encoded = name.encode("utf-8")
+        parts.append(struct.pack("<B", len(encoded)) + encoded)
+    encoded = level.name.encode("utf-8")
+    parts.append(struct.pack("<H", len(encoded)) + encoded)
+
+    parts.append(_little_endian(array("I", [gate.id for gate in gates])).tobytes())
+    parts.append(_little_endian(array("H", [type_codes[gate.type] for gate in gates])).tobytes())
+    parts.append(_little_endian(array("i", [int(c) for gate in gates for c in gate.position])).tobytes())
+
+    for side in ("from_i", "to_i"):
+        endpoints = [getattr(wire, side) for wire in level.wires]
+        parts.append(_little_endian(array("I", [e[0] for e in endpoints])).tobytes())
+        parts.append(array("B", [_kind_codes[e[1]] for e in endpoints]).tobytes())
+        parts.append(_little_endian(array("H", [e[2] for e in endpoints])).tobytes())
+    return b"".join(parts)
+
+
+def _decode_arrays(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Not a circuit file")
+    magic, version, n_types, n_gates, n_wires = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a circuit file")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Circuit format version {version} is newer than supported ({FORMAT_VERSION})")
+    offset = HEADER.size
+
+    type_names = []
+    for _ in range(n_types):
+        name, offset = _read_string(data, offset, "<B")
+        type_names.append(name)
+    _, offset = _read_string(data, offset, "<H")
+
+    ids, offset = _read_array("I", data, offset, n_gates)
+    codes, offset = _read_array("H", data, offset, n_gates)
+    if codes and max(codes) >= len(type_names):
+        raise ValueError("Invalid gate type code in circuit file")
+    positions, offset = _read_array("i", data, offset, 2 * n_gates)
+
+    sides = []
+    for _ in range(2):
+        side_ids, offset = _read_array("I", data, offset, n_wires)
+        kinds, offset = _read_array("B", data, offset, n_wires)
+        pins, offset = _read_array("H", data, offset, n_wires)
+        if kinds and max(kinds) >= len(ENDPOINT_KINDS):
+            raise ValueError("Invalid wire endpoint kind in circuit file")
+        sides.append([(side_ids[i], ENDPOINT_KINDS[kinds[i]], pins[i]) for i in range(n_wires)])
+    return type_names, ids, codes, positions, sides
+
+
+def _parse_binary(level, data):
+    type_names, ids, codes, positions, sides = _decode_arrays(data)
+
+    # One template copy per gate, created straight into the id -> gate map
+    gates = {}
+    for i in range(len(ids)):
+        gates[ids[i]] = new_gate(type_names[codes[i]], ids[i], (positions[2 * i], positions[2 * i + 1]))
+    if len(gates) != len(ids):
+        raise ValueError("Duplicate gate id in circuit file")
+
+    wires = [Wire(from_i, to_i) for from_i, to_i in zip(*sides)]
+    check_wires(level, gates, wires)
+    return gates, wires
+
+
+def decode_binary(level, data):
+    level.load_circuit(*_parse_binary(level, data))
+
+
+def save_circuit(level, path):
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(circuit_to_dict(level), f)
+    else:
+        with open(path, "wb") as f:
+            f.write(encode_binary(level))
+
+
+def read_circuit(level, path):
+    # Gates and wires of a circuit file, checked against level but not
+    # loaded into it
+    with _gc_paused():
+        if path.endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                return _parse_dict(level, json.load(f))
+        with open(path, "rb") as f:
+            return _parse_binary(level, f.read())
+
+
+def load_circuit(level, path):
+    with _gc_paused():
+        level.load_circuit(*read_circuit(level, path))
+
+
+def _single_driver(wires):
+    # Netlist.connect checks each endpoint exists; this adds the rule that
+    # check_wires enforces for levels
+    sinks = set()
+    for from_i, to_i in wires:
+        if to_i in sinks:
+            raise ValueError(f"Wire endpoint {tuple(to_i)} has more than one driver")
+        sinks.add(to_i)
+        yield from_i, to_i
+
+
+def load_netlist(path, n_inputs, n_outputs):
+    # Straight into the array-backed Netlist, without building a Level:
+    # for sandbox circuits too large to keep one object per pin
+    with _gc_paused():
+        if path.endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                gates, wires = _json_rows(json.load(f))
+        else:
+            with open(path, "rb") as f:
+                type_names, ids, codes, positions, sides = _decode_arrays(f.read())
+            if len(set(ids)) != len(ids):
+                raise ValueError("Duplicate gate id in circuit file")
+            gates = ((ids[i], type_names[codes[i]], (positions[2 * i], positions[2 * i + 1])) for i in range(len(ids)))
+            wires = zip(*sides)
+        return Netlist.build(n_inputs, n_outputs, logic_gates, gates, _single_driver(wires))
@@ -0,0 +1,97 @@
+import os, sys, json, argparse, multiprocessing
+
+# The grader never opens a window or loads pygame; should anything pull it
+# in, keep its import banner out of the JSONL stream on stdout.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from logic import Level, CombinationalLoopError
+from levels import levels
+from circuit_io import circuit_from_dict
+
+levels_by_name = {lvl.name: lvl for lvl in levels}
+
+# Submissions are one JSON circuit (see circuit_io) per line, with an "id"
+# and a "level" given by name or index into levels:
+# {"id": "...", "level": "HALF ADDER",
+#  "gates": [{"id": 0, "type": "XOR", "position": [x, y]}, ...],
+#  "wires": [[[0, "TERMINAL_I", 0], [0, "GATE_I", 0]], ...]}
+
+
+def new_level(template):
+    return Level(template.name, len(template.inputs), template.allowed_gates, template.function, template.instructions)
+
+
+def find_level(key):
+    if isinstance(key, int):
+        return levels[key]
+    return levels_by_name[key]
+
+
+def over_budget(level, template):
+    used = {}
+    for gate in level.gates.values():
+        used[gate.type] = used.get(gate.type, 0) + 1
+    return {gt: n for gt, n in used.items() if template.allowed_gates.get(gt, 0) != -1 and n > template.allowed_gates.get(gt, 0)}
+
+
+def grade(line):
+    result = {"id": None, "level": None, "passed": False}
+    try:
+        submission = json.loads(line)
+        result["id"] = submission.get("id")
+        template = find_level(submission["level"])
+        result["level"] = template.name
+
+        level = new_level(template)
+        circuit_from_dict(level, submission)
+        result["gates"] = len(level.gates)
+
+        budget = over_budget(level, template)
+        if budget:
+            result["over_budget"] = budget
+
+        level.compile()
+        passed = level.evaluate()
+        result["passed"] = passed and not budget
+        if level.first_failure:
+            result["first_failure"] = level.first_failure
+    except CombinationalLoopError as e:
+        result["error"] = "combinational_loop"
+        result["loops"] = e.loops
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def submissions(path):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        for line in stream:
+            if line.strip():
+                yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade saved circuits against the game levels, headless.")
+    parser.add_argument("submissions", nargs="?", default="-", help="JSONL file with one submission per line (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="where to write the JSONL results (default: stdout)")
+    parser.add_argument("-j", "--processes", type=int, default=os.cpu_count(), help="worker processes (1 grades in-process)")
+    parser.add_argument("--chunksize", type=int, default=64, help="submissions handed to a worker at a time")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        if args.processes <= 1:
+            for result in map(grade, submissions(args.submissions)):
+                out.write(json.dumps(result) + "\n")
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                for result in pool.imap_unordered(grade, submissions(args.submissions), chunksize=args.chunksize):
+                    out.write(json.dumps(result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from logic import Gate, Level
+
+def level0_function(inputs):
+    return [inputs[0]]
+
+def level1_function(inputs):
+    return [not inputs[0]]
+
+def level2_function(inputs):
+    return [inputs[0] or inputs[1]]
+
+def level3_function(inputs):
+    return [inputs[0] and inputs[1]]
+
+def level4_function(inputs):
+    return [not(inputs[0] or inputs[1])]
+
+def level5_function(inputs):
+    return [not(inputs[0] and inputs[1])]
+
+def level6_function(inputs):
+    return [True if inputs[0] != inputs[1] else False]
+
+def level7_function(inputs):
+    return [False if inputs[0] != inputs[1] else True]
+
+def level8_function(inputs):
+    sum_bit = inputs[0] ^ inputs[1]
+    carry_out = inputs[0] and inputs[1]
+    return [sum_bit, carry_out]
+
+def level9_function(inputs):
+    sum_bit = (inputs[0] ^ inputs[1]) ^ inputs[2]
+    carry_out = (inputs[0] and inputs[1]) or (inputs[1] and inputs[2]) or (inputs[0] and inputs[2])
+    return [sum_bit, carry_out]
+
+def gate_half_adder(inputs):
+    sum_bit = inputs[0] ^ inputs[1]
+    carry_out = inputs[0] and inputs[1]
+    return [sum_bit, carry_out]
+
+def level10_function(inputs):
+    diff = inputs[0] ^ inputs[1]
+    borrow = (not inputs[0]) and inputs[1]
+    return [diff, borrow]
+
+def level11_function(inputs):
+    diff = (inputs[0] ^ inputs[1]) ^ inputs[2]
+    borrow = ((not inputs[0]) and inputs[1]) or ((not inputs[0]) and inputs[2]) or (inputs[1] and inputs[2])
+    return [diff, borrow]
+
+
+levels = [  Level("INTRO", 1, {}, level0_function, "Bem vindo ao jogo de Lógica Digital! Neste jogo, você irá aprender sobre portas lógicas e como elas funcionam. Para começar clique o botão direito do mouse no terminal de entrada e depois no de saída. Para finalizar o nível aperte Enter ou clique no botão de executar."),
+            Level("NOT", 1, {'NOT': 1}, level1_function, "Agora vamos aprender sobre a porta NOT. Ela inverte o valor de entrada. Clique e arraste a porta NOT para o circuito, conecte-a ao terminal de entrada e depois ao terminal de saída. Para finalizar o nível aperte Enter ou clique no botão de executar."),
+            Level("OR", 2, {'OR': 1}, level2_function, "A porta OR retorna verdadeiro se pelo menos uma entrada for verdadeira. Caso você queira saber a tabela verdade de uma porta lógica, aperte a tecla T ou clique no botão de tabela verdade."),
+            Level("AND", 2, {'AND': 1}, level3_function, "A porta AND retorna verdadeiro se todas as entradas forem verdadeiras."),
+            Level("NOR", 2, {'OR': 1, 'NOT': 1}, level4_function, "A porta NOR é a combinação da porta OR com a NOT. Ela retorna verdadeiro apenas se todas as entradas forem falsas."),
+            Level("NAND", 2, {'AND': 1, 'NOT': 1}, level5_function, "A porta NAND é a combinação da porta AND com a NOT. Ela retorna verdadeiro se pelo menos uma entrada for falsa. Você pode usar a porta NAND para criar todas as outras portas lógicas."),
+            Level("OR - NAND", 2, {'NAND': 3}, level2_function, "Neste nível, você deve usar apenas portas NAND para criar uma porta OR."),
+            Level("XOR", 2, {'OR': 1, 'AND': 2, 'NOT': 2}, level6_function, "Agora vamos aprender sobre a porta XOR. Ela retorna verdadeiro se apenas uma das entradas for verdadeira."),
+            Level("XNOR", 2, {'XOR': 1, 'NOT': 1}, level7_function, "A porta XNOR é a combinação da porta XOR com a NOT. Ela retorna verdadeiro se as entradas forem iguais."),
+            Level("HALF ADDER", 2, {'XOR': 1, 'AND': 1}, level8_function, "Neste nível, você deve usar uma porta XOR e uma porta AND para criar um somador de meio bit (half adder). O somador de meio bit recebe duas entradas e retorna a soma e o carry."),
+            Level("FULL ADDER", 3, {'XOR': 2, 'AND': 2, 'OR': 1}, level9_function, "Neste nível, você deve usar duas portas XOR, duas portas AND e uma porta OR para criar um somador completo (full adder). O somador completo recebe três entradas: A, B e Cin (carry in) e retorna a soma e o carry out."),
+            Level("FULL ADDER 2", 3, {'OR': 1, 'HALF ADDER': 2}, level9_function, "Neste nível, você deve usar duas portas HALF ADDER e uma porta OR para criar um somador completo (full adder)."),
+            Level("HALF SUBT", 2, {'XOR': 1, 'AND': 1, 'NOT': 1}, level10_function, "Neste nível, você deve usar uma porta XOR, uma porta AND e uma porta NOT para criar um subtrator de meio bit (half subtractor). O subtrator de meio bit recebe duas entradas e retorna a diferença e o borrow."),
+            Level("FULL SUBT", 3, {'NOT': 2, 'XOR': 2, 'AND': 2, 'OR': 1}, level11_function, "Neste nível, você deve criar um subtrator completo (full subtractor). O subtrator completo recebe três entradas: A, B e Bin (borrow in) e retorna a diferença e o borrow out."),
+        ]
+
+logic_gates = {
+    'AND': Gate('AND', 2, 1, (0, 0)),
+    'OR': Gate('OR', 2, 1, (0, 0)),
+    'NOT': Gate('NOT', 1, 1, (0, 0)),
+    'XOR': Gate('XOR', 2, 1, (0, 0)),
+    'NAND': Gate('NAND', 2, 1, (0, 0)),
+    'NOR': Gate('NOR', 2, 1, (0, 0)),
+    "XNOR": Gate("XNOR", 2, 1, (0, 0)),
+    'HALF ADDER': Gate('HALF ADDER', 2, 2, (0, 0), gate_half_adder),
+}
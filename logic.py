@@ -1,8 +1,15 @@
-import pygame, sys, os
+import sys, os, heapq, hashlib
+from collections import deque, OrderedDict
 from typing import List, Tuple
-from ui import draw_text
+from ui import draw_text, lazy_import, get_image, get_font, Camera, profiler
 
-WIDTH, HEIGHT = 800, 600
+# pygame is only loaded once something is drawn, so the simulation core
+# (Terminal, Gate, Wire, Level compile/evaluate) imports without it
+pygame = lazy_import("pygame")
+
+# Size of the area the level terminals are laid out in, in world units; the
+# camera maps world to screen
+FIELD = (800, 600)
 
 white = (255, 255, 255)
 green = (34, 139, 34)
@@ -10,11 +17,38 @@ wire_color_false = (100, 100, 100)
 button_hover = (50, 200, 50)
 button_bg = (40, 40, 40)
 panel_bg = (50, 50, 50)
-
-pygame.font.init()
-gate_font = pygame.font.SysFont('arial', 20)
-quantity_font = pygame.font.SysFont('arial', 14)
-expected_font = pygame.font.SysFont('arial', 10)
+hover_outline = (255, 220, 80)
+
+GATE_RADIUS = 30
+
+# Below LOD_ZOOM gates are drawn without pins and terminals without labels.
+# Culling keeps anything within CULL_MARGIN world units of the viewport, and
+# wires are bucketed for it in WIRE_CELL sized squares; a wire whose bounding
+# box covers more than LONG_WIRE_CELLS of them is checked on its own instead.
+LOD_ZOOM = 0.5
+CULL_MARGIN = 50
+WIRE_CELL = 256
+LONG_WIRE_CELLS = 16
+
+def terminal_position(kind, i, field=FIELD):
+    width, height = field
+    x = width // 8 if kind == "TERMINAL_I" else width - width // 8
+    return (x, height // 6 + i * height // 10 + 3)
+
+# Gate labels shrink with the length of the type name
+def label_font(text):
+    type_len = len(text)
+    if type_len <= 3:
+        return get_font('arial', 20)
+    elif type_len <= 4:
+        return get_font('arial', 18)
+    elif type_len <= 8:
+        return get_font('arial', 14)
+    return get_font('arial', 10)
+
+def line_bounds(a, b, width=5):
+    rect = pygame.Rect(min(a[0], b[0]), min(a[1], b[1]), abs(a[0] - b[0]) + 1, abs(a[1] - b[1]) + 1)
+    return rect.inflate(width + 2, width + 2)
 
 def resource_path(relative_path):
     try:
@@ -31,49 +65,392 @@ default_gates = {"AND": [resource_path("images//AND.png"), [[-20, -10], [-20, 10
                  "NAND": [resource_path("images//NAND.png"), [[-20, -10], [-20, 10]], [20, 0, 1]],
                  "NOR": [resource_path("images//NOR.png"), [[-20, -10], [-20, 10]], [20, 0, 1]]}
 
-_image_cache = {}
+# Compiled circuit functions keyed by (target, structural hash), least
+# recently used first
+COMPILE_CACHE_SIZE = 256
+_compile_cache = OrderedDict()
+
+# Pin offsets from the gate centre per (type, inputs, outputs); custom gates
+# spread their pins evenly along the sides of an 80x60 box
+_pin_offsets = {}
+
+def pin_offsets(gate_type, n_inputs, n_outputs):
+    key = (gate_type, n_inputs, n_outputs)
+    offsets = _pin_offsets.get(key)
+    if offsets is None:
+        if gate_type in default_gates:
+            inputs = [tuple(offset) for offset in default_gates[gate_type][1][:n_inputs]]
+            outputs = [tuple(default_gates[gate_type][2][:2])] * n_outputs
+        else:
+            # Caso hajam gates personalizados
+            rect_width, rect_height = 80, 60
+            inputs = [(-rect_width // 2, -rect_height // 2 + (i + 1) * (rect_height // (n_inputs + 1))) for i in range(n_inputs)]
+            outputs = [(rect_width // 2, -rect_height // 2 + (i + 1) * (rect_height // (n_outputs + 1))) for i in range(n_outputs)]
+        offsets = _pin_offsets[key] = (inputs, outputs)
+    return offsets
 
 def load_gate_image(gate_type: str):
-    if gate_type in _image_cache:
-        return _image_cache[gate_type]
-    
     if gate_type in default_gates:
-        image_path = default_gates[gate_type][0]
-        image = pygame.image.load(image_path).convert_alpha()
-        image = pygame.transform.scale(image, (60, 60))
-        _image_cache[gate_type] = image
-        return image
-    
+        return get_image(default_gates[gate_type][0], (60, 60))
+
     raise ValueError(f"Gate type '{gate_type}' not found.")
 
+# Pre-rendered gates (body, label and pins) per (type, pin counts, pin
+# value bitmask, selected, zoom), with their offset from the gate centre. A
+# mask of None leaves the pins out.
+_gate_sprites = {}
+
+def gate_sprite(gate_type, n_inputs, n_outputs, mask, selected, zoom=1.0):
+    key = (gate_type, n_inputs, n_outputs, mask, selected, zoom)
+    sprite = _gate_sprites.get(key)
+    if sprite is not None:
+        return sprite
+    if zoom != 1.0:
+        image, (left, top) = gate_sprite(gate_type, n_inputs, n_outputs, mask, selected)
+        size = (max(1, round(image.get_width() * zoom)), max(1, round(image.get_height() * zoom)))
+        sprite = _gate_sprites[key] = (pygame.transform.smoothscale(image, size), (round(left * zoom), round(top * zoom)))
+        return sprite
+
+    input_offsets, output_offsets = pin_offsets(gate_type, n_inputs, n_outputs)
+    if gate_type in default_gates:
+        left, top, width, height = -GATE_RADIUS, -GATE_RADIUS, 2 * GATE_RADIUS, 2 * GATE_RADIUS
+        circle_not = [default_gates[gate_type][2][2]] + [0] * (n_outputs - 1)
+    else:
+        left, top, width, height = -46, -30, 92, 60
+        circle_not = [0] * n_outputs
+    image = pygame.Surface((width, height), pygame.SRCALPHA)
+    ox, oy = -left, -top
+
+    if gate_type in default_gates:
+        # MAX onto a transparent surface copies the image pixels unblended
+        image.blit(load_gate_image(gate_type), (ox - GATE_RADIUS, oy - GATE_RADIUS), special_flags=pygame.BLEND_RGBA_MAX)
+    else:
+        rect_width, rect_height = 80, 60
+        rect = pygame.Rect(ox - rect_width // 2, oy - rect_height // 2, rect_width, rect_height)
+        pygame.draw.rect(image, button_hover if selected else button_bg, rect, border_radius=10)
+        pygame.draw.rect(image, white, rect, 2, border_radius=10)
+        font = label_font(gate_type)
+        text_w, text_h = font.size(gate_type)
+        draw_text(image, gate_type, (ox - text_w // 2, oy - text_h // 2), font)
+
+    if mask is None:
+        input_offsets = output_offsets = ()
+    for i, (px, py) in enumerate(input_offsets):
+        pos = (ox + px, oy + py)
+        color = green if mask >> i & 1 else button_bg
+        pygame.draw.rect(image, white, (pos[0] - 6, pos[1] - 6, 12, 12))
+        pygame.draw.rect(image, color, (pos[0] - 4, pos[1] - 4, 8, 8))
+    # Built-in gates only ever showed their first output pin
+    shown = 1 if gate_type in default_gates else n_outputs
+    for i, (px, py) in enumerate(output_offsets[:shown]):
+        pos = (ox + px, oy + py)
+        color = green if mask >> (n_inputs + i) & 1 else button_bg
+        if circle_not[i]:
+            pygame.draw.circle(image, white, pos, 6)
+            pygame.draw.circle(image, color, pos, 4)
+        else:
+            pygame.draw.rect(image, white, (pos[0] - 6, pos[1] - 6, 12, 12))
+            pygame.draw.rect(image, color, (pos[0] - 4, pos[1] - 4, 8, 8))
+
+    sprite = _gate_sprites[key] = (image, (left, top))
+    return sprite
+
+INPUT_LABEL_X = 30
+
+def terminal_label_pos(term, to_screen):
+    # Input values are labelled at the left edge of the field, output values
+    # to their right; the text itself doesn't scale with the camera
+    x, y = to_screen(term.pos)
+    if term.type == "TERMINAL_I":
+        x = to_screen((INPUT_LABEL_X, term.pos[1]))[0]
+    else:
+        x += 20
+    return x, y - 13
+
+def draw_terminal(screen, term, to_screen=tuple, zoom=1.0, label=True):
+    # A level terminal drawn through to_screen (world -> screen; the default
+    # is the identity camera)
+    pos = to_screen(term.pos)
+    pygame.draw.circle(screen, white, pos, max(1, round(12 * zoom)))
+    pygame.draw.circle(screen, green if term.value else button_bg, pos, max(1, round(10 * zoom)))
+    if label:
+        draw_text(screen, f"{term.value}", terminal_label_pos(term, to_screen), get_font('arial', 20))
+
+class CombinationalLoopError(ValueError):
+    def __init__(self, loops):
+        super().__init__(f"Combinational loop through gates {loops}")
+        self.loops = loops
+
+
+def find_combinational_loops(nodes, successors):
+    # Strongly connected components (Kosaraju, iterative) restricted to nodes;
+    # every component with more than one gate, or a gate feeding itself, is a loop.
+    node_set = set(nodes)
+    finished = []
+    seen = set()
+    for start in nodes:
+        if start in seen:
+            continue
+        seen.add(start)
+        stack = [(start, iter(successors[start]))]
+        while stack:
+            node, it = stack[-1]
+            for nxt in it:
+                if nxt in node_set and nxt not in seen:
+                    seen.add(nxt)
+                    stack.append((nxt, iter(successors[nxt])))
+                    break
+            else:
+                stack.pop()
+                finished.append(node)
+
+    predecessors = {node: [] for node in nodes}
+    for node in nodes:
+        for nxt in successors[node]:
+            if nxt in node_set:
+                predecessors[nxt].append(node)
+
+    loops = []
+    assigned = set()
+    for start in reversed(finished):
+        if start in assigned:
+            continue
+        assigned.add(start)
+        component = []
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            component.append(node)
+            for prev in predecessors[node]:
+                if prev not in assigned:
+                    assigned.add(prev)
+                    stack.append(prev)
+        if len(component) > 1 or start in successors[start]:
+            loops.append(sorted(component))
+    return loops
+
+
+def packed_input_columns(n):
+    # Column i has bit r set when input i is true in row r (x[i] = (r >> i) & 1)
+    rows = 1 << n
+    columns = []
+    for i in range(n):
+        width = 1 << i
+        column = ((1 << width) - 1) << width
+        period = width * 2
+        while period < rows:
+            column |= column << period
+            period *= 2
+        columns.append(column)
+    return columns
+
+
+def pack_truth_table(function, n_inputs, n_outputs):
+    rows = [[] for _ in range(n_outputs)]
+    for r in range(1 << n_inputs):
+        values = function([(r >> bit) & 1 == 1 for bit in range(n_inputs)])
+        for j in range(n_outputs):
+            rows[j].append("1" if values[j] else "0")
+    return [int("".join(reversed(bits)), 2) if bits else 0 for bits in rows]
+
+
+def packed_gate_function(gate):
+    # Custom gates only expose a scalar function, so expand their truth table
+    # once and rebuild each output as a sum of minterms over the packed inputs.
+    n_inputs = len(gate.inputs)
+    tables = pack_truth_table(gate.function, n_inputs, len(gate.outputs))
+
+    def packed(inputs, mask):
+        results = []
+        for table in tables:
+            out = 0
+            for r in range(1 << n_inputs):
+                if (table >> r) & 1:
+                    term = mask
+                    for bit in range(n_inputs):
+                        term &= inputs[bit] if (r >> bit) & 1 else mask ^ inputs[bit]
+                    out |= term
+            results.append(out)
+        return results
+    return packed
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("The batch evaluator requires NumPy (pip install numpy)") from None
+    return numpy
+
+
+def lookup_gate_function(gate):
+    # Vectorized fallback for custom gates: index a precomputed truth table
+    # with the input bits of every row in the batch at once.
+    np = _import_numpy()
+    n_inputs = len(gate.inputs)
+    table = np.array([gate.function([(r >> bit) & 1 == 1 for bit in range(n_inputs)]) for r in range(1 << n_inputs)], dtype=bool)
+
+    def batch(inputs):
+        index = np.zeros(len(inputs[0]) if n_inputs else 0, dtype=np.intp)
+        for bit, column in enumerate(inputs):
+            index |= column.astype(np.intp) << bit
+        return table[index].T
+    return batch
+
+
+def _nested(func, args):
+    expr = args[0]
+    for arg in args[1:]:
+        expr = f"{func}({expr}, {arg})"
+    return expr
+
+
+# Expression templates per compile target: "scalar" works on one row of
+# bools, "packed" on whole truth tables packed into ints (m is the row mask)
+# and "numpy" on boolean column arrays of a batch (f is an all-False column).
+compile_targets = {
+    "scalar": {
+        "ARGS": "x",
+        "FALSE": "False",
+        "AND": lambda a: f"({' and '.join(a)})",
+        "OR": lambda a: f"({' or '.join(a)})",
+        "NOT": lambda a: f"(not {a[0]})",
+        "NAND": lambda a: f"(not ({' and '.join(a)}))",
+        "NOR": lambda a: f"(not ({' or '.join(a)}))",
+        "XOR": lambda a: f"({a[0]} != {a[1]})",
+        "XNOR": lambda a: f"({a[0]} == {a[1]})",
+        "CUSTOM": lambda gate: gate.function,
+        "CALL": lambda name, a: f"{name}([{', '.join(a)}])",
+    },
+    "packed": {
+        "ARGS": "x, m",
+        "FALSE": "0",
+        "AND": lambda a: f"({' & '.join(a)})",
+        "OR": lambda a: f"({' | '.join(a)})",
+        "NOT": lambda a: f"(m ^ {a[0]})",
+        "NAND": lambda a: f"(m ^ ({' & '.join(a)}))",
+        "NOR": lambda a: f"(m ^ ({' | '.join(a)}))",
+        "XOR": lambda a: f"({a[0]} ^ {a[1]})",
+        "XNOR": lambda a: f"(m ^ {a[0]} ^ {a[1]})",
+        "CUSTOM": packed_gate_function,
+        "CALL": lambda name, a: f"{name}([{', '.join(a)}], m)",
+    },
+    "numpy": {
+        "ARGS": "x, f",
+        "FALSE": "f",
+        "AND": lambda a: _nested("np.logical_and", a),
+        "OR": lambda a: _nested("np.logical_or", a),
+        "NOT": lambda a: f"np.logical_not({a[0]})",
+        "NAND": lambda a: f"np.logical_not({_nested('np.logical_and', a)})",
+        "NOR": lambda a: f"np.logical_not({_nested('np.logical_or', a)})",
+        "XOR": lambda a: f"np.logical_xor({a[0]}, {a[1]})",
+        "XNOR": lambda a: f"np.logical_not(np.logical_xor({a[0]}, {a[1]}))",
+        "CUSTOM": lookup_gate_function,
+        "CALL": lambda name, a: f"{name}([{', '.join(a)}])",
+        "GLOBALS": lambda: {"np": _import_numpy()},
+    },
+}
+
+
+class SpatialGrid:
+    # Uniform grid of points keyed like wire endpoints, (id, kind, pin): a
+    # lookup only visits the cells its search radius overlaps.
+    def __init__(self, cell_size=32):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.points = {}
+
+    def cell(self, x, y):
+        return (int(x) // self.cell_size, int(y) // self.cell_size)
+
+    def insert(self, key, pos):
+        if key in self.points:
+            self.remove(key)
+        self.points[key] = pos
+        cell = (int(pos[0]) // self.cell_size, int(pos[1]) // self.cell_size)
+        keys = self.cells.get(cell)
+        if keys is None:
+            self.cells[cell] = {key}
+        else:
+            keys.add(key)
+
+    def insert_many(self, items):
+        # Bulk insert of (key, pos) pairs whose keys are not in the grid yet
+        size, cells, points = self.cell_size, self.cells, self.points
+        for key, pos in items:
+            points[key] = pos
+            cell = (int(pos[0]) // size, int(pos[1]) // size)
+            keys = cells.get(cell)
+            if keys is None:
+                cells[cell] = {key}
+            else:
+                keys.add(key)
+
+    def remove(self, key):
+        pos = self.points.pop(key, None)
+        if pos is not None:
+            cell = self.cell(*pos)
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.points.clear()
+
+    def nearest(self, pos, radius, kinds):
+        # Closest point of one of the given kinds strictly within radius
+        x0, y0 = self.cell(pos[0] - radius, pos[1] - radius)
+        x1, y1 = self.cell(pos[0] + radius, pos[1] + radius)
+        best, best_dist = None, radius * radius
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                for key in self.cells.get((cx, cy), ()):
+                    if key[1] not in kinds:
+                        continue
+                    px, py = self.points[key]
+                    dist = (pos[0] - px) ** 2 + (pos[1] - py) ** 2
+                    if dist < best_dist or (dist == best_dist and best is not None and key < best):
+                        best, best_dist = key, dist
+        return best
+
+    def query(self, rect, kinds):
+        # Keys of the given kinds whose point lies inside rect
+        x0, y0 = self.cell(rect.left, rect.top)
+        x1, y1 = self.cell(rect.right, rect.bottom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # Zoomed far out: fewer occupied cells than cells in view
+            cells = [keys for (cx, cy), keys in self.cells.items() if x0 <= cx <= x1 and y0 <= cy <= y1]
+        else:
+            cells = [self.cells[cell] for cell in ((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)) if cell in self.cells]
+        points = self.points
+        return [key for keys in cells for key in keys if key[1] in kinds and rect.collidepoint(points[key])]
+
 
 class Terminal:
-    def __init__(self, i: int, type_: str, value: bool=False, isNot: bool=False):
+    __slots__ = ("i", "type", "pos", "value", "isNot")
+
+    def __init__(self, i: int, type_: str, value: bool=False, isNot: bool=False, pos: Tuple[int, int]=(0, 0)):
         self.i: int = i
         self.type: str = type_
-        self.pos: Tuple[int, int] = self.calculate_position()
+        self.pos: Tuple[int, int] = pos
         self.value: bool = value
         self.isNot: bool = isNot
 
-    def calculate_position(self):
-        pos = (0, 0)
-        if self.type == "TERMINAL_I":
-            pos = (WIDTH // 8, HEIGHT // 6 + self.i * HEIGHT // 10 + 3)
-        elif self.type == "TERMINAL_O":
-            pos = (WIDTH - WIDTH // 8, HEIGHT // 6 + self.i * HEIGHT // 10 + 3)
-        return pos
-
     def __str__(self):
         return f"Terminal(i={self.i}, type={self.type}, pos={self.pos}, value={self.value}, isNot={self.isNot})"
 
 class Gate:
+    __slots__ = ("id", "type", "inputs", "outputs", "position", "radius", "function")
+
     def __init__(self, gate_type: str, inputs: int, outputs: int, position: Tuple[int,int], function=None):
         self.id = None
         self.type = gate_type.upper()
         self.inputs = [Terminal(i, "GATE_I", False) for i in range(inputs)]
         self.outputs = [Terminal(i, "GATE_O", False) for i in range(outputs)]
         self.position = position
-        self.radius = 30
+        self.radius = GATE_RADIUS
         self.function = function
 
         if self.type in ["NOT", "NAND", "NOR", "XNOR"]:
@@ -82,96 +459,62 @@ class Gate:
     def copy(self):
         return Gate(gate_type=self.type, inputs=len(self.inputs), outputs=len(self.outputs), position=self.position, function=self.function)
 
-    def draw(self, screen, x=-1, y=-1, selected=False):
+    def placed(self, gate_id, position):
+        # Copy of this template with an id, at position, with its pins
+        # already placed: the bulk path for loading saved circuits
+        gate = Gate.__new__(Gate)
+        gate.id = gate_id
+        gate.type = self.type
+        gate.position = position
+        gate.radius = self.radius
+        gate.function = self.function
+        x, y = position
+        input_offsets, output_offsets = pin_offsets(self.type, len(self.inputs), len(self.outputs))
+        gate.inputs = [Terminal(i, "GATE_I", False, False, (x + dx, y + dy)) for i, (dx, dy) in enumerate(input_offsets)]
+        gate.outputs = [Terminal(term.i, "GATE_O", False, term.isNot, (x + dx, y + dy)) for (dx, dy), term in zip(output_offsets, self.outputs)]
+        return gate
+
+    def draw(self, screen, x=-1, y=-1, selected=False, zoom=1.0):
         if x == -1 and y == -1:
             x, y = self.position
-            
-        if self.type in default_gates.keys():
-            image = load_gate_image(self.type)
-            screen.blit(image, (x - self.radius, y - self.radius))
-        else:
-            rect_width, rect_height = 80, 60
-            rect = pygame.Rect(self.position[0] - rect_width // 2, self.position[1] - rect_height // 2, rect_width, rect_height)
-            pygame.draw.rect(screen, button_hover if selected else button_bg, rect, border_radius=10)
-            pygame.draw.rect(screen, white, rect, 2, border_radius=10)
-
-            type_len = len(self.type)
-            if type_len <= 3:
-                font = pygame.font.SysFont('arial', 20)
-            elif type_len <= 4:
-                font = pygame.font.SysFont('arial', 18)
-            elif type_len <= 8:
-                font = pygame.font.SysFont('arial', 14)
-            else:
-                font = pygame.font.SysFont('arial', 10)
-            draw_text(screen, self.type, (self.position[0] - font.size(self.type)[0] // 2, self.position[1] - font.size(self.type)[1] // 2), font)
-            
-        # Draw input terminals
-        input_positions = self.get_input_positions()
-        for i, pos in input_positions:
-            color = green if self.inputs[i].value else button_bg
-            pygame.draw.rect(screen, white, (pos[0] - 6, pos[1] - 6, 12, 12))
-            pygame.draw.rect(screen, color, (pos[0] - 4, pos[1] - 4, 8, 8))
-
-        # Draw output terminals
-        output_positions = self.get_output_positions()
-        for i, pos, circle_not in output_positions:
-            color = green if self.outputs[i].value else button_bg
-            if circle_not:
-                pygame.draw.circle(screen, white, pos, 6)
-                pygame.draw.circle(screen, color, pos, 4)
-            else:
-                pygame.draw.rect(screen, white, (pos[0] - 6, pos[1] - 6, 12, 12))
-                pygame.draw.rect(screen, color, (pos[0] - 4, pos[1] - 4, 8, 8))
-
-    def update(self):
-        self.evaluate()        
+        image, (dx, dy) = self.sprite(selected, zoom)
+        screen.blit(image, (x + dx, y + dy))
+
+    def sprite(self, selected=False, zoom=1.0, pins=True):
+        mask = None
+        if pins:
+            mask = 0
+            for bit, term in enumerate(self.inputs + self.outputs):
+                if term.value:
+                    mask |= 1 << bit
+        return gate_sprite(self.type, len(self.inputs), len(self.outputs), mask, selected, zoom)
+
+    def bounds(self):
+        # Everything draw() can touch, plus the ring drawn around gates in a loop
+        x, y = self.position
+        ring = self.radius + 9
+        if self.type in default_gates:
+            return pygame.Rect(x - ring, y - ring, 2 * ring, 2 * ring)
+        return pygame.Rect(x - 46, y - ring, 92, 2 * ring)
 
     def udpate_terminal_positions(self):
+        x, y = self.position
+        input_offsets, output_offsets = pin_offsets(self.type, len(self.inputs), len(self.outputs))
         for term in self.inputs:
-            if self.type in default_gates.keys():
-                term.pos = (self.position[0] + default_gates[self.type][1][term.i][0], self.position[1] + default_gates[self.type][1][term.i][1])
-            else: 
-                # Caso hajam gates personalizados
-                break
+            dx, dy = input_offsets[term.i]
+            term.pos = (x + dx, y + dy)
         for term in self.outputs:
-            if self.type in default_gates.keys():
-                pos = (default_gates[self.type][2][0], default_gates[self.type][2][1])
-                pos = (self.position[0] + pos[0], self.position[1] + pos[1])
-                term.pos = pos
-            else:
-                # Caso hajam gates personalizados
-                break
+            dx, dy = output_offsets[term.i]
+            term.pos = (x + dx, y + dy)
 
     def get_input_positions(self):
-        positions = []
-        if self.type in default_gates.keys():
-            for term in self.inputs:
-                positions.append((term.i, term.pos))
-        else:
-            rect_width, rect_height = 80, 60
-            for i in range(len(self.inputs)):
-                x_off = -rect_width // 2
-                y_off = -rect_height // 2 + (i + 1) * (rect_height // (len(self.inputs) + 1))
-                pos = (self.position[0] + x_off, self.position[1] + y_off)
-                self.inputs[i].pos = pos
-                positions.append((i, pos))
-        return positions
+        return [(term.i, term.pos) for term in self.inputs]
 
     def get_output_positions(self):
-        positions = []
         if self.type in default_gates.keys():
             term = self.outputs[0]
-            positions.append((term.i, term.pos, term.isNot))
-        else:
-            rect_width, rect_height = 80, 60
-            for i in range(len(self.outputs)):
-                x_offset = rect_width // 2
-                y_offset = -rect_height // 2 + (i + 1) * (rect_height // (len(self.outputs) + 1))
-                pos = (self.position[0] + x_offset, self.position[1] + y_offset)
-                self.outputs[i].pos = pos
-                positions.append((i, pos, 0))
-        return positions
+            return [(term.i, term.pos, term.isNot)]
+        return [(term.i, term.pos, 0) for term in self.outputs]
     
     def evaluate(self):
         match self.type:
@@ -203,6 +546,8 @@ class Gate:
 
 
 class Wire:
+    __slots__ = ("from_i", "to_i", "value", "color")
+
     def __init__(self, from_i: Tuple[int, str, int], to_i: Tuple[int, str, int], value=False):
         self.from_i = from_i
         self.to_i = to_i
@@ -213,17 +558,6 @@ class Wire:
         from_pos = self.get_port_pos(ports, False)
         to_pos = self.get_port_pos(ports, True)
         pygame.draw.line(screen, self.color, from_pos, to_pos, 5)
-        
-    def update(self, ports):
-        self.update_own_value(ports)
-        self.color = green if self.value else wire_color_false
-        self.set_value_to_out(ports)
-    
-    def draw_one_point(self, screen, ports, mouse_pos):
-        self.color = green if self.value else wire_color_false
-        from_pos = self.get_port_pos(ports, False) if self.from_i else mouse_pos
-        to_pos = self.get_port_pos(ports, True) if self.to_i else mouse_pos
-        pygame.draw.line(screen, self.color, from_pos, to_pos, 5)
 
     def get_port_pos(self, ports, isTo):
         value = self.to_i if isTo else self.from_i
@@ -236,22 +570,6 @@ class Wire:
         else:
             pos = ports[value[1]][value[0]].pos
         return pos
-    
-    def update_own_value(self, ports):
-        if self.from_i[1] == "GATE_O":
-            gate = ports["GATE"][self.from_i[0]]
-            self.value = gate.outputs[self.from_i[2]].value
-        elif self.from_i[1] == "TERMINAL_I":
-            term = ports["TERMINAL_I"][self.from_i[0]]
-            self.value = term.value
-
-    def set_value_to_out(self, ports):
-        if self.to_i[1] == "GATE_I":
-            gate = ports["GATE"][self.to_i[0]]
-            gate.inputs[self.to_i[2]].value = self.value
-        elif self.to_i[1] == "TERMINAL_O":
-            term = ports["TERMINAL_O"][self.to_i[0]]
-            term.value = self.value
 
     def __str__(self):
         return f"Wire(from={self.from_i}, to={self.to_i}, value={self.value})"
@@ -260,57 +578,530 @@ class Wire:
 class Level:
     def __init__(self, name: str, inputs: int, allowed_gates: dict[str, int], function=None, instructions: str = "", isSim: bool = False):
         self.name = name
-        self.inputs = [Terminal(i, "TERMINAL_I", False) for i in range(inputs)]
+        self.inputs = [Terminal(i, "TERMINAL_I", False, pos=terminal_position("TERMINAL_I", i)) for i in range(inputs)]
         if isSim:
             self.expected = [False] * len(self.inputs)
         else:
             self.expected = function([term.value for term in self.inputs])
-        self.outputs = [Terminal(i, "TERMINAL_O") for i in range(len(self.expected))]
+        self.outputs = [Terminal(i, "TERMINAL_O", pos=terminal_position("TERMINAL_O", i)) for i in range(len(self.expected))]
         self.allowed_gates = allowed_gates.copy()
         self.gates: dict[int, Gate] = {}
-        self.wires: List[Wire] = []
+        # Insertion-ordered set of wires (dict keys), so removal is O(1)
+        self.wires: dict[Wire, None] = {}
         self.current_wire: Wire = None
         self.function = function
         self.palette = []
         self.current_function = None
+        self.current_packed_function = None
+        self.current_batch_function = None
+        self.packed_expected = None
+        self.packed_actual = None
+        self.first_failure = None
+
+        # Truth-table overlay: first visible row and the last rendered table
+        self.truth_table_scroll = 0
+        self.truth_table_surface = None
+        self.instructions_panel = None
+        # Every wire composited onto one transparent layer, redrawn only after
+        # a wire is added or removed or an endpoint moves (each bumps
+        # wire_version), a value flips (wire_color_version) or the camera
+        # moves. The wire index (wire_cells) is kept up to date per wire.
+        self.wire_version = 0
+        self.wire_color_version = 0
+        self.wire_layer = None
+        self.wire_regions = None
+        self.wire_cells = None
+        self.wire_seq = 0
+        self.camera = Camera()
         self.completed = False
         self.instructions = instructions
         self.isSimulator = isSim
 
+        # Event-driven simulation state: wires fanning out of each source
+        # endpoint (id, kind, pin) and the gates waiting to be re-evaluated,
+        # ordered by their topological rank.
+        self.fanout: dict[Tuple[int, str, int], List[Wire]] = {}
+        self.pending = []
+        self.pending_ids = set()
+
+        # Adjacency: wires into each sink endpoint and wires touching each
+        # gate, so edits and fan-in checks cost O(degree) instead of O(wires)
+        self.fanin: dict[Tuple[int, str, int], List[Wire]] = {}
+        self.gate_wires: dict[int, dict[Wire, None]] = {}
+
+        # Levelization, rebuilt lazily after a structural edit that can break
+        # the current order; removals only prune it
+        self.structure_dirty = True
+        self.order_pruned = False
+        self.next_rank = 0
+        self.order: List[int] = []
+        self.rank: dict[int, int] = {}
+        self.loops: List[List[int]] = []
+
+        # Structural hashing for the compile cache: the driver of every sink
+        # endpoint, a hash per gate covering its whole input cone, and the
+        # outputs whose cone changed since their hash was last computed.
+        self.drivers: dict[Tuple[int, str, int], Tuple[int, str, int]] = {}
+        self.node_hash: dict[int, str] = {}
+        self.output_hash: dict[int, str] = {}
+        self.dirty_outputs = set(range(len(self.outputs)))
+
+        # Hit-testing: gate centres (id, "GATE", 0), gate pins and the level
+        # terminals, by position, plus whatever the cursor is over
+        self.grid = SpatialGrid()
+        for term in self.inputs + self.outputs:
+            self.grid.insert((term.i, term.type, 0), term.pos)
+        self.hover = None
+        # Gates from load_circuit, put in the grid on the first lookup or edit
+        self.unindexed = []
+
     def reset(self):
-        temp_gates = list(self.gates.values())
-        for gate in temp_gates:
-            self.remove_gate(gate)
+        # Drops the whole circuit at once instead of gate by gate
+        self.unindexed = []
+        for gate in self.gates.values():
+            self.unindex_gate(gate)
             self.allowed_gates[gate.type] += 1
+        self.gates.clear()
+        self.hover = None
         self.wires.clear()
+        self.fanout.clear()
+        self.fanin.clear()
+        self.gate_wires.clear()
+        self.wire_version += 1
+        self.wire_cells = None
+        self.pending.clear()
+        self.pending_ids.clear()
+        self.structure_dirty = True
+        self.drivers.clear()
+        self.node_hash.clear()
+        self.dirty_outputs = set(range(len(self.outputs)))
         for term in self.outputs:
             term.value = False
         self.current_wire = None
         self.current_function = None
+        self.current_packed_function = None
+        self.current_batch_function = None
 
     def add_gate(self, gate):
         id = max(self.gates.keys()) + 1 if len(self.gates) > 0 else 0
         gate.id = id
         self.gates[id] = gate
+        gate.udpate_terminal_positions()
+        self.index_gate(gate)
+        if self.structure_dirty or self.loops:
+            self.structure_dirty = True
+        else:
+            # An unconnected gate can go last in the current order
+            self.order.append(id)
+            self.rank[id] = self.next_rank
+            self.next_rank += 1
+        self.schedule(id)
+        self.propagate()
 
     def remove_gate(self, gate):
         idx_gate = gate.id
 
-        wires = [wire for wire in self.wires if (
-            (wire.from_i[1] == "GATE_O" and wire.from_i[0] == idx_gate) or
-            (wire.to_i[1] == "GATE_I" and wire.to_i[0] == idx_gate)
-        )]
-        
-        for wire in wires:
-            if wire.to_i[1] == "GATE_I":
-                gate = self.gates[wire.to_i[0]]
-                gate.inputs[wire.to_i[2]].value = False
-            elif wire.to_i[1] == "TERMINAL_O":
-                term = self.outputs[wire.to_i[0]]
-                term.value = False
-            self.wires.remove(wire)
-        
+        for wire in list(self.gate_wires.get(idx_gate, ())):
+            self.remove_wire(wire, propagate=False)
+
         self.gates.pop(idx_gate)
+        self.unindex_gate(gate)
+        if self.hover and self.hover[0] == idx_gate and self.hover[1].startswith("GATE"):
+            self.hover = None
+        self.pending_ids.discard(idx_gate)
+        self.node_hash.pop(idx_gate, None)
+        self.rank.pop(idx_gate, None)
+        self.structure_removed()
+        self.propagate()
+
+    def index_loaded(self):
+        items = []
+        for gate in self.unindexed:
+            gid = gate.id
+            items.append(((gid, "GATE", 0), gate.position))
+            items += [((gid, "GATE_I", term.i), term.pos) for term in gate.inputs]
+            items += [((gid, "GATE_O", term.i), term.pos) for term in gate.outputs]
+        self.unindexed = []
+        self.grid.insert_many(items)
+
+    def index_gate(self, gate):
+        if self.unindexed:
+            self.index_loaded()
+        self.grid.insert((gate.id, "GATE", 0), gate.position)
+        for term in gate.inputs:
+            self.grid.insert((gate.id, "GATE_I", term.i), term.pos)
+        for term in gate.outputs:
+            self.grid.insert((gate.id, "GATE_O", term.i), term.pos)
+
+    def unindex_gate(self, gate):
+        if self.unindexed:
+            self.index_loaded()
+        self.grid.remove((gate.id, "GATE", 0))
+        for term in gate.inputs:
+            self.grid.remove((gate.id, "GATE_I", term.i))
+        for term in gate.outputs:
+            self.grid.remove((gate.id, "GATE_O", term.i))
+
+    def move_gate(self, gate, position):
+        # Called every frame of a drag, also while the gate is held still
+        if gate.position == position:
+            return
+        gate.position = position
+        gate.udpate_terminal_positions()
+        if self.gates.get(gate.id) is gate:
+            self.index_gate(gate)
+            if gate.id in self.gate_wires:
+                self.wire_version += 1
+                if self.wire_cells is not None:
+                    ports = self.ports()
+                    for wire in self.gate_wires[gate.id]:
+                        self.index_wire(wire, ports, self.unindex_wire(wire))
+
+    def endpoint_at(self, pos, radius, kinds):
+        # (id, kind, pin) of the closest gate, pin or terminal of one of the
+        # given kinds within radius of pos, or None
+        if self.unindexed:
+            self.index_loaded()
+        return self.grid.nearest(pos, radius, kinds)
+
+    def gate_at(self, pos):
+        if self.unindexed:
+            self.index_loaded()
+        key = self.grid.nearest(pos, GATE_RADIUS, ("GATE",))
+        return self.gates[key[0]] if key else None
+
+    def update_hover(self, pos, pin_radius, terminal_radius):
+        self.hover = (self.endpoint_at(pos, pin_radius, ("GATE_I", "GATE_O"))
+                      or self.endpoint_at(pos, terminal_radius, ("TERMINAL_I", "TERMINAL_O"))
+                      or self.endpoint_at(pos, GATE_RADIUS, ("GATE",)))
+        return self.hover
+
+    def hover_circle(self):
+        if self.hover is None:
+            return None
+        idx, kind, pin = self.hover
+        if kind == "GATE":
+            return self.gates[idx].position, GATE_RADIUS + 4
+        elif kind == "GATE_I":
+            return self.gates[idx].inputs[pin].pos, 9
+        elif kind == "GATE_O":
+            return self.gates[idx].outputs[pin].pos, 9
+        terminals = self.inputs if kind == "TERMINAL_I" else self.outputs
+        return terminals[idx].pos, 15
+
+    def link_wire(self, wire):
+        wire.from_i = tuple(wire.from_i[:3])
+        wire.to_i = tuple(wire.to_i)
+        self.wires[wire] = None
+        self.wire_version += 1
+        if self.wire_cells is not None:
+            self.index_wire(wire, self.ports(), self.wire_seq)
+            self.wire_seq += 1
+        self.fanout.setdefault(wire.from_i, []).append(wire)
+        self.fanin.setdefault(wire.to_i, []).append(wire)
+        for endpoint in (wire.from_i, wire.to_i):
+            if endpoint[1] in ("GATE_I", "GATE_O"):
+                self.gate_wires.setdefault(endpoint[0], {})[wire] = None
+        self.drivers[wire.to_i] = wire.from_i
+
+    def unlink_wire(self, wire):
+        del self.wires[wire]
+        self.wire_version += 1
+        if self.wire_cells is not None:
+            self.unindex_wire(wire)
+        for index, endpoint in ((self.fanout, wire.from_i), (self.fanin, wire.to_i)):
+            wires = index.get(endpoint)
+            if wires is not None:
+                wires.remove(wire)
+                if not wires:
+                    del index[endpoint]
+        for endpoint in (wire.from_i, wire.to_i):
+            wires = self.gate_wires.get(endpoint[0]) if endpoint[1] in ("GATE_I", "GATE_O") else None
+            if wires is not None:
+                wires.pop(wire, None)
+                if not wires:
+                    del self.gate_wires[endpoint[0]]
+        if self.drivers.get(wire.to_i) == wire.from_i:
+            # Another wire may still drive the sink (only possible in loaded files)
+            remaining = self.fanin.get(wire.to_i)
+            if remaining:
+                self.drivers[wire.to_i] = remaining[-1].from_i
+            else:
+                del self.drivers[wire.to_i]
+
+    def add_wire(self, wire):
+        self.link_wire(wire)
+        self.invalidate_cone(wire.to_i)
+        src, dst = wire.from_i, wire.to_i
+        if src[1] == "GATE_O" and dst[1] == "GATE_I" and not (
+                not self.structure_dirty and not self.loops and self.rank[src[0]] < self.rank[dst[0]]):
+            # Only an edge against the current order needs a new levelization
+            self.structure_dirty = True
+        self.drive_wire(wire, self.source_value(wire.from_i))
+        self.propagate()
+
+    def load_circuit(self, gates, wires):
+        # Bulk counterpart of add_gate/add_wire for saved circuits: gates keep
+        # their ids, indexes are built in one pass and the circuit settles once.
+        if self.gates or self.wires:
+            raise ValueError(f"Level '{self.name}' must be empty to load a circuit; reset() it first")
+        self.gates.update(gates)
+        self.unindexed = list(gates.values())
+
+        # Same bookkeeping as link_wire, in one pass; endpoints are already
+        # (id, kind, pin) tuples, as circuit_io builds them
+        all_wires, fanout, fanin, gate_wires, drivers = self.wires, self.fanout, self.fanin, self.gate_wires, self.drivers
+        for wire in wires:
+            src, dst = wire.from_i, wire.to_i
+            all_wires[wire] = None
+            linked = fanout.get(src)
+            if linked is None:
+                fanout[src] = [wire]
+            else:
+                linked.append(wire)
+            linked = fanin.get(dst)
+            if linked is None:
+                fanin[dst] = [wire]
+            else:
+                linked.append(wire)
+            if src[1] == "GATE_O":
+                touching = gate_wires.get(src[0])
+                if touching is None:
+                    gate_wires[src[0]] = {wire: None}
+                else:
+                    touching[wire] = None
+            if dst[1] == "GATE_I":
+                touching = gate_wires.get(dst[0])
+                if touching is None:
+                    gate_wires[dst[0]] = {wire: None}
+                else:
+                    touching[wire] = None
+            drivers[dst] = src
+        self.wire_version += 1
+        self.wire_cells = None
+        self.node_hash.clear()
+        self.dirty_outputs = set(range(len(self.outputs)))
+        self.structure_dirty = True
+
+        # Settle in one topological sweep, pushing each source value down its
+        # wires once; gates start with every input False
+        all_gates, outputs = self.gates, self.outputs
+
+        def push(src, value):
+            color = green if value else wire_color_false
+            for wire in fanout.get(src, ()):
+                wire.value = value
+                wire.color = color
+                dst = wire.to_i
+                if dst[1] == "GATE_I":
+                    all_gates[dst[0]].inputs[dst[2]].value = value
+                else:
+                    outputs[dst[0]].value = value
+
+        for term in self.inputs:
+            push((term.i, "TERMINAL_I", 0), term.value)
+        for gid in self.levelize():
+            gate = all_gates[gid]
+            gate.evaluate()
+            for term in gate.outputs:
+                push((gid, "GATE_O", term.i), term.value)
+        # Gates on or behind loops are left to the regular budgeted propagation
+        for gid, rank in self.rank.items():
+            if rank == len(self.order):
+                self.schedule(gid)
+        self.propagate()
+
+    def remove_wire(self, wire, propagate=True):
+        self.unlink_wire(wire)
+        self.invalidate_cone(wire.to_i)
+        self.structure_removed()
+        self.drive_wire(wire, False)
+        if propagate:
+            self.propagate()
+
+    def invalidate_cone(self, endpoint):
+        # Drops the structural hash of every gate downstream of a changed sink
+        # endpoint and marks the outputs it reaches. A gate without a hash
+        # already has its whole fan-out invalidated, so the walk stops there.
+        stack = [endpoint]
+        while stack:
+            sink = stack.pop()
+            if sink[1] == "TERMINAL_O":
+                self.dirty_outputs.add(sink[0])
+            elif sink[1] == "GATE_I" and sink[0] in self.node_hash:
+                gid = sink[0]
+                del self.node_hash[gid]
+                for term in self.gates[gid].outputs:
+                    for wire in self.fanout.get((gid, "GATE_O", term.i), ()):
+                        stack.append(wire.to_i)
+
+    def source_hash(self, src):
+        if src is None:
+            return "0"
+        elif src[1] == "TERMINAL_I":
+            return f"x{src[0]}"
+        elif src[1] == "GATE_O":
+            return f"{self.node_hash[src[0]]}:{src[2]}"
+        return "0"
+
+    def structure_key(self):
+        # Canonical, id-independent hash of the circuit: one Merkle-style hash
+        # per output cone. Only gates invalidated since the last call are
+        # rehashed.
+        for gid in self.levelize():
+            if gid not in self.node_hash:
+                gate = self.gates[gid]
+                parts = [gate.type, str(id(gate.function))]
+                parts.extend(self.source_hash(self.drivers.get((gid, "GATE_I", i))) for i in range(len(gate.inputs)))
+                self.node_hash[gid] = hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+        for i in self.dirty_outputs:
+            self.output_hash[i] = self.source_hash(self.drivers.get((i, "TERMINAL_O", 0)))
+        self.dirty_outputs.clear()
+        return tuple(self.output_hash[i] for i in range(len(self.outputs)))
+
+    def cached_function(self, target):
+        key = (target, self.structure_key())
+        if key in _compile_cache:
+            _compile_cache.move_to_end(key)
+            return _compile_cache[key]
+        logic_func = self.build_function(target)
+        _compile_cache[key] = logic_func
+        if len(_compile_cache) > COMPILE_CACHE_SIZE:
+            _compile_cache.popitem(last=False)
+        return logic_func
+
+    def set_input(self, i, value):
+        term = self.inputs[i]
+        if term.value == value:
+            return
+        term.value = value
+        self.update_expected()
+        for wire in self.fanout.get((i, "TERMINAL_I", 0), ()):
+            self.drive_wire(wire, value)
+        self.propagate()
+
+    def set_inputs(self, values):
+        # Applies a whole input vector before anything settles, so the circuit
+        # never evaluates the intermediate vectors
+        changed = [i for i, value in enumerate(values) if self.inputs[i].value != value]
+        if not changed:
+            return
+        for i in changed:
+            self.inputs[i].value = values[i]
+        self.update_expected()
+        for i in changed:
+            for wire in self.fanout.get((i, "TERMINAL_I", 0), ()):
+                self.drive_wire(wire, values[i])
+        self.propagate()
+
+    def update_expected(self):
+        if self.isSimulator:
+            self.expected = [False] * len(self.inputs)
+        else:
+            self.expected = self.function([term.value for term in self.inputs])
+
+    def source_value(self, src):
+        if src[1] == "GATE_O":
+            return self.gates[src[0]].outputs[src[2]].value
+        elif src[1] == "TERMINAL_I":
+            return self.inputs[src[0]].value
+        return False
+
+    def drive_wire(self, wire, value):
+        if wire.value != value:
+            self.wire_color_version += 1
+        wire.value = value
+        wire.color = green if value else wire_color_false
+        if wire.to_i[1] == "GATE_I":
+            gate = self.gates.get(wire.to_i[0])
+            if gate is not None and gate.inputs[wire.to_i[2]].value != value:
+                gate.inputs[wire.to_i[2]].value = value
+                self.schedule(gate.id)
+        elif wire.to_i[1] == "TERMINAL_O":
+            self.outputs[wire.to_i[0]].value = value
+
+    def structure_removed(self):
+        # Deleting gates or wires keeps a topological order valid, so unless a
+        # loop may have been broken the order is only pruned, not rebuilt
+        if self.loops:
+            self.structure_dirty = True
+        else:
+            self.order_pruned = True
+
+    def levelize(self):
+        if not self.structure_dirty:
+            if self.order_pruned:
+                self.order = [gid for gid in self.order if gid in self.gates]
+                self.order_pruned = False
+            return self.order
+
+        successors = {gid: [] for gid in self.gates}
+        indegree = dict.fromkeys(self.gates, 0)
+        for wire in self.wires:
+            if wire.from_i[1] == "GATE_O" and wire.to_i[1] == "GATE_I":
+                successors[wire.from_i[0]].append(wire.to_i[0])
+                indegree[wire.to_i[0]] += 1
+
+        ready = deque(gid for gid, degree in indegree.items() if degree == 0)
+        order = []
+        while ready:
+            gid = ready.popleft()
+            order.append(gid)
+            for nxt in successors[gid]:
+                indegree[nxt] -= 1
+                if indegree[nxt] == 0:
+                    ready.append(nxt)
+
+        self.order = order
+        self.rank = {gid: r for r, gid in enumerate(order)}
+        # Gates on or behind a loop have no topological position; they go last
+        # and are settled iteratively under the propagation budget.
+        unordered = [gid for gid in self.gates if gid not in self.rank]
+        for gid in unordered:
+            self.rank[gid] = len(order)
+        self.loops = find_combinational_loops(unordered, successors) if unordered else []
+        self.structure_dirty = False
+        self.order_pruned = False
+        self.next_rank = len(order) + 1
+
+        # Ranks changed, so rebuild the queue with the new priorities
+        self.pending = [(self.rank[gid], gid) for gid in self.pending_ids if gid in self.gates]
+        heapq.heapify(self.pending)
+        return order
+
+    def schedule(self, gate_id):
+        if gate_id not in self.pending_ids:
+            self.pending_ids.add(gate_id)
+            heapq.heappush(self.pending, (self.rank.get(gate_id, len(self.order)), gate_id))
+
+    def propagate(self, budget=None):
+        # Re-evaluates only the gates downstream of a changed value, in
+        # topological order, so an acyclic circuit settles in a single pass.
+        # The budget keeps a combinational loop from spinning forever inside
+        # one call; what is left over stays pending for the next call.
+        if self.structure_dirty:
+            self.levelize()
+        if not self.pending:
+            return 0
+        if budget is None:
+            budget = 4 * len(self.gates) + 64
+        evaluations = 0
+        while self.pending and evaluations < budget:
+            _, gate_id = heapq.heappop(self.pending)
+            if gate_id not in self.pending_ids:
+                continue
+            self.pending_ids.discard(gate_id)
+            gate = self.gates.get(gate_id)
+            if gate is None:
+                continue
+            old_values = [term.value for term in gate.outputs]
+            gate.evaluate()
+            evaluations += 1
+            for term, old in zip(gate.outputs, old_values):
+                if term.value != old:
+                    for wire in self.fanout.get((gate_id, "GATE_O", term.i), ()):
+                        self.drive_wire(wire, term.value)
+        return evaluations
 
     def draw_palette(self, screen, width, height):
         panel_height = int(height * 0.16)
@@ -323,7 +1114,6 @@ class Level:
         pygame.draw.rect(screen, panel_bg, (0, panel_y, width, panel_height), border_radius=15)
         pygame.draw.rect(screen, white, (0, panel_y, width, panel_height), 2, border_radius=15)
 
-        font_cache = {}
         for gt, pos in self.palette:
             value = self.allowed_gates.get(gt, -1)
 
@@ -336,78 +1126,129 @@ class Level:
             border_color = (255, 0, 0) if value == 0 else white
             pygame.draw.rect(screen, border_color, rect, 2, border_radius=10)
 
-            type_len = len(gt)
-            if type_len not in font_cache:
-                if type_len <= 3:
-                    font_cache[type_len] = gate_font
-                elif type_len <= 4:
-                    font_cache[type_len] = pygame.font.SysFont('arial', 18)
-                elif type_len <= 8:
-                    font_cache[type_len] = pygame.font.SysFont('arial', 14)
-                else:
-                    font_cache[type_len] = pygame.font.SysFont('arial', 10)
-            font = font_cache[type_len]
+            font = label_font(gt)
             draw_text(screen, gt, (pos[0] - font.size(gt)[0] // 2, pos[1] - font.size(gt)[1] // 2), font,)
 
             if value > 0:
                 num_text = str(value)
+                quantity_font = get_font('arial', 14)
                 num_pos = (rect.right - quantity_font.size(num_text)[0] - 6, rect.bottom - quantity_font.size(num_text)[1] - 4)
                 draw_text(screen, num_text, num_pos, quantity_font)
 
-    def draw_truth_table(self, screen, width, height):
+    def packed_actual_table(self):
+        # The player's circuit over every row, packed like packed_expected and
+        # recomputed only when its structure changes. None while it has a loop.
+        self.levelize()
+        if self.loops:
+            return None
+        key = self.structure_key()
+        if self.packed_actual is None or self.packed_actual[0] != key:
+            n = len(self.inputs)
+            packed_function = self.cached_function("packed")
+            self.packed_actual = (key, packed_function(packed_input_columns(n), (1 << (1 << n)) - 1))
+        return self.packed_actual
+
+    def scroll_truth_table(self, rows):
+        self.truth_table_scroll += rows
+
+    def draw_truth_table(self, screen, width, height, show_actual=True):
         if not self.inputs or not self.expected:
             return
 
         n_inputs = len(self.inputs)
         n_outputs = len(self.outputs)
-        table_width = 60 * (n_inputs + n_outputs)
-        table_height = 30 * (2 ** n_inputs + 1)
-        center_x = width // 2
-        center_y = height // 2
+        n_rows = 1 << n_inputs
+        cell_w = 60
+        cell_h = 30
 
-        start_x = center_x - table_width // 2
-        start_y = center_y - table_height // 2
+        # Only as many rows as fit in 80% of the window are drawn; the rest
+        # is reached by scrolling
+        visible_rows = max(1, min(n_rows, int(height * 0.8) // cell_h - 1))
+        self.truth_table_scroll = max(0, min(self.truth_table_scroll, n_rows - visible_rows))
+        first_row = self.truth_table_scroll
+
+        actual = self.packed_actual_table() if show_actual else None
+        n_columns = n_inputs + n_outputs * (2 if actual else 1)
+        table_width = cell_w * n_columns
+        table_height = cell_h * (visible_rows + 1)
+
+        key = (first_row, visible_rows, actual[0] if actual else None)
+        if self.truth_table_surface is None or self.truth_table_surface[0] != key:
+            surf = self.render_truth_table(first_row, visible_rows, actual[1] if actual else None, table_width, table_height, cell_w, cell_h)
+            self.truth_table_surface = (key, surf)
+
+        start_x = width // 2 - table_width // 2
+        start_y = height // 2 - table_height // 2
+        screen.blit(self.truth_table_surface[1], (start_x, start_y))
+
+        if visible_rows < n_rows:
+            track = table_height - cell_h
+            bar_h = max(10, track * visible_rows // n_rows)
+            bar_y = start_y + cell_h + (track - bar_h) * first_row // (n_rows - visible_rows)
+            pygame.draw.rect(screen, white, (start_x + table_width + 4, bar_y, 6, bar_h), border_radius=3)
+
+    def render_truth_table(self, first_row, visible_rows, actual, table_width, table_height, cell_w, cell_h):
+        n_inputs = len(self.inputs)
+        n_outputs = len(self.outputs)
+        expected = self.packed_expected_table()
+        surf = pygame.Surface((table_width + 1, table_height + 1), pygame.SRCALPHA)
 
         # Draw gray background
-        bg_rect = pygame.Rect(start_x, start_y, table_width, table_height)
-        pygame.draw.rect(screen, (60, 60, 60), bg_rect, border_radius=10)
+        pygame.draw.rect(surf, (60, 60, 60), (0, 0, table_width, table_height), border_radius=10)
 
         # Draw header
-        header_font = pygame.font.SysFont('arial', 16)
-        cell_w = 60
-        cell_h = 30
-
+        header_font = get_font('arial', 16)
         for i in range(n_inputs):
-            draw_text(screen, f"In {i+1}", (start_x + i * cell_w + 10, start_y + 5), header_font)
+            draw_text(surf, f"In {i+1}", (i * cell_w + 10, 5), header_font)
         for i in range(n_outputs):
-            draw_text(screen, f"Out {i+1}", (start_x + (n_inputs + i) * cell_w + 10, start_y + 5), header_font)
-
-        # Rows
-        row_font = pygame.font.SysFont('arial', 14)
-        for row in range(2 ** n_inputs):
-            y = start_y + (row + 1) * cell_h
-            # Input
+            draw_text(surf, f"Out {i+1}", ((n_inputs + i) * cell_w + 10, 5), header_font)
+            if actual:
+                draw_text(surf, f"Circ {i+1}", ((n_inputs + n_outputs + i) * cell_w + 6, 5), header_font)
+
+        # Rows. Row r lists input 1 as its most significant bit, while bit p
+        # of the packed tables has input i at bit i, so p is r bit-reversed.
+        row_font = get_font('arial', 14)
+        for visible in range(visible_rows):
+            row = first_row + visible
+            y = (visible + 1) * cell_h
             bits = [(row >> (n_inputs - 1 - i)) & 1 for i in range(n_inputs)]
+            p = sum(bit << i for i, bit in enumerate(bits))
+            exp_values = [(exp >> p) & 1 for exp in expected]
+            if actual:
+                act_values = [(act >> p) & 1 for act in actual]
+                if act_values != exp_values:
+                    pygame.draw.rect(surf, (150, 40, 40), (0, y, table_width, cell_h))
             for i, bit in enumerate(bits):
-                draw_text(screen, str(bit), (start_x + i * cell_w + 25, y + 7), row_font)
-            # Output
-            expected = self.function([bool(b) for b in bits])
-            for i, val in enumerate(expected):
-                draw_text(screen, str(int(val)), (start_x + (n_inputs + i) * cell_w + 25, y + 7), row_font)
+                draw_text(surf, str(bit), (i * cell_w + 25, y + 7), row_font)
+            for i, val in enumerate(exp_values):
+                draw_text(surf, str(val), ((n_inputs + i) * cell_w + 25, y + 7), row_font)
+            if actual:
+                for i, val in enumerate(act_values):
+                    draw_text(surf, str(val), ((n_inputs + n_outputs + i) * cell_w + 25, y + 7), row_font)
 
         # Grid
-        for i in range(n_inputs + n_outputs + 1):
-            x = start_x + i * cell_w
-            pygame.draw.line(screen, white, (x, start_y), (x, start_y + table_height), 1)
-        for i in range(2 ** n_inputs + 2):
-            y = start_y + i * cell_h
-            pygame.draw.line(screen, white, (start_x, y), (start_x + table_width, y), 1)
+        n_columns = table_width // cell_w
+        for i in range(n_columns + 1):
+            x = i * cell_w
+            pygame.draw.line(surf, white, (x, 0), (x, table_height), 1)
+        for i in range(visible_rows + 2):
+            y = i * cell_h
+            pygame.draw.line(surf, white, (0, y), (table_width, y), 1)
+        return surf
 
     def draw_instructions(self, screen, width, height):
         if not self.instructions:
             return
 
-        font = pygame.font.SysFont("Arial", 20)
+        # The wrapped text and its panel only change with the window width
+        key = (self.instructions, width)
+        if self.instructions_panel is None or self.instructions_panel[0] != key:
+            self.instructions_panel = (key, self.render_instructions(width))
+        panel = self.instructions_panel[1]
+        screen.blit(panel, panel.get_rect(center=(width // 2, int(height * 0.75))), special_flags=pygame.BLEND_PREMULTIPLIED)
+
+    def render_instructions(self, width):
+        font = get_font("Arial", 20)
         max_width = int(width * 0.8)
         words = self.instructions.split()
         lines = []
@@ -428,69 +1269,240 @@ class Level:
         text_width = max(surf.get_width() for surf in text_surfaces)
         text_height = total_height
 
-        center_x = width // 2
-        center_y = int(height * 0.75)
-        text_rect = pygame.Rect(0, 0, text_width, text_height)
-        text_rect.center = (center_x, center_y)
-
-        bg_surface = pygame.Surface(text_rect.size, pygame.SRCALPHA)
-        bg_surface.fill((0, 0, 0, 160))
-        screen.blit(bg_surface, text_rect.topleft)
-
+        # Text area plus the 4px the border sticks out on each side. The panel
+        # is kept with premultiplied alpha so antialiased text over the
+        # translucent fill composes exactly as it did when drawn in layers.
+        text_rect = pygame.Rect(4, 4, text_width, text_height)
         border_rect = text_rect.inflate(8, 8)
-        pygame.draw.rect(screen, (255, 255, 255), border_rect, 2, border_radius=8)
+        panel = pygame.Surface(border_rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 160), text_rect)
+        pygame.draw.rect(panel, (255, 255, 255), border_rect, 2, border_radius=8)
 
+        text = pygame.Surface(text_rect.size, pygame.SRCALPHA)
         for i, surf in enumerate(text_surfaces):
-            line_pos = (text_rect.left, text_rect.top + i * line_height)
-            screen.blit(surf, line_pos)
+            text.blit(surf, (0, i * line_height))
+        panel.blit(text.premul_alpha(), text_rect, special_flags=pygame.BLEND_PREMULTIPLIED)
+        return panel
+
+    def ports(self):
+        return {"TERMINAL_I": self.inputs, "TERMINAL_O": self.outputs, "GATE": self.gates}
+
+    def visible_gates(self, view):
+        # Gates centred inside the world rect view, in drawing order
+        if self.unindexed:
+            self.index_loaded()
+        return [self.gates[gid] for gid in sorted(key[0] for key in self.grid.query(view, ("GATE",)))]
+
+    def wire_index(self):
+        # Per wire its drawing-order sequence number, world endpoints,
+        # bounding box and the WIRE_CELL squares it crosses (None for long
+        # wires); the wires in each square; and the long wires. Built on
+        # first use, then updated wire by wire as wires are linked, unlinked
+        # or their gates move.
+        if self.wire_cells is None:
+            self.wire_cells = ({}, {}, {})
+            ports = self.ports()
+            for seq, wire in enumerate(self.wires):
+                self.index_wire(wire, ports, seq)
+            self.wire_seq = len(self.wires)
+        return self.wire_cells
+
+    def index_wire(self, wire, ports, seq):
+        spans, cells, long_wires = self.wire_cells
+        a = wire.get_port_pos(ports, False)
+        b = wire.get_port_pos(ports, True)
+        left, right = int(min(a[0], b[0])), int(max(a[0], b[0]))
+        top, bottom = int(min(a[1], b[1])), int(max(a[1], b[1]))
+        x0, x1, y0, y1 = left // WIRE_CELL, right // WIRE_CELL, top // WIRE_CELL, bottom // WIRE_CELL
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > LONG_WIRE_CELLS:
+            keys = None
+            long_wires[wire] = None
+        else:
+            keys = [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+            for key in keys:
+                bucket = cells.get(key)
+                if bucket is None:
+                    cells[key] = {wire: None}
+                else:
+                    bucket[wire] = None
+        spans[wire] = (seq, a, b, (left, top, right, bottom), keys)
+
+    def unindex_wire(self, wire):
+        # Returns the wire's sequence number, for re-indexing it in place
+        spans, cells, long_wires = self.wire_cells
+        seq, _, _, _, keys = spans.pop(wire)
+        if keys is None:
+            del long_wires[wire]
+        else:
+            for key in keys:
+                bucket = cells[key]
+                del bucket[wire]
+                if not bucket:
+                    del cells[key]
+        return seq
+
+    def visible_wires(self, view):
+        spans, cells, long_wires = self.wire_index()
+        x0, x1 = view.left // WIRE_CELL, view.right // WIRE_CELL
+        y0, y1 = view.top // WIRE_CELL, view.bottom // WIRE_CELL
+        found = set()
+        for wire in long_wires:
+            left, top, right, bottom = spans[wire][3]
+            if left < view.right and right >= view.left and top < view.bottom and bottom >= view.top:
+                found.add(wire)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            for (cx, cy), bucket in cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    found.update(bucket)
+        else:
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    found.update(cells.get((cx, cy), ()))
+        return [(wire, span[1], span[2]) for span, wire in sorted((spans[wire], wire) for wire in found)]
+
+    def current_wire_ends(self, mouse_pos):
+        wire = self.current_wire
+        ports = self.ports()
+        from_pos = self.camera.to_screen(wire.get_port_pos(ports, False)) if wire.from_i else mouse_pos
+        to_pos = self.camera.to_screen(wire.get_port_pos(ports, True)) if wire.to_i else mouse_pos
+        return from_pos, to_pos
+
+    def screen_hover(self):
+        hover = self.hover_circle()
+        if hover is None:
+            return None
+        return self.camera.to_screen(hover[0]), max(1, round(hover[1] * self.camera.zoom))
 
     def draw(self, screen, width, height, mouse_pos):
-        if self.isSimulator:
-            self.expected = [False] * len(self.inputs)
-        else:
-            self.expected = self.function([term.value for term in self.inputs])
+        gate_font = get_font('arial', 20)
+        expected_font = get_font('arial', 10)
+        camera = self.camera
+        to_screen = camera.to_screen
+        zoom = camera.zoom
+        # Zoomed out, pins and terminal labels are too small to read
+        detailed = zoom >= LOD_ZOOM
+        view = camera.viewport(width, height, CULL_MARGIN)
 
         self.draw_palette(screen, width, height)
+        profiler.lap("palette")
 
         self.draw_instructions(screen, width, height)
+        profiler.lap("instructions")
 
         for term in self.inputs:
-            color = green if term.value else button_bg
-            pygame.draw.circle(screen, white, term.pos, 12)
-            pygame.draw.circle(screen, color, term.pos, 10)
-            draw_text(screen, f"{term.value}", (30, term.pos[1] - 13), gate_font)
+            if view.collidepoint(term.pos):
+                draw_terminal(screen, term, to_screen, zoom, detailed)
         for term in self.outputs:
-            color = green if term.value else button_bg
-            pygame.draw.circle(screen, white, term.pos, 12)
-            pygame.draw.circle(screen, color, term.pos, 10)
-            draw_text(screen, f"{term.value}", (term.pos[0] + 20, term.pos[1] - 13), gate_font)
-            if not self.isSimulator:
-                draw_text(screen, f"Esperado: {self.expected[term.i]}", (term.pos[0] + 20, term.pos[1] + 5), expected_font)
-        for gate in self.gates.values():
-            gate.update()
-            gate.draw(screen)
+            if not view.collidepoint(term.pos):
+                continue
+            pos = to_screen(term.pos)
+            draw_terminal(screen, term, to_screen, zoom, detailed)
+            if detailed and not self.isSimulator:
+                draw_text(screen, f"Esperado: {self.expected[term.i]}", (pos[0] + 20, pos[1] + 5), expected_font)
+        blits = []
+        cx, cy = camera.x, camera.y
+        for gate in self.visible_gates(view):
+            image, (dx, dy) = gate.sprite(zoom=zoom, pins=detailed)
+            x, y = gate.position
+            blits.append((image, (round((x - cx) * zoom) + dx, round((y - cy) * zoom) + dy)))
+        screen.blits(blits, doreturn=False)
+
+        if self.loops:
+            for loop in self.loops:
+                for gid in loop:
+                    gate = self.gates[gid]
+                    if view.collidepoint(gate.position):
+                        pygame.draw.circle(screen, (200, 50, 50), to_screen(gate.position), round((gate.radius + 6) * zoom), max(1, round(3 * zoom)))
+            warning = "Loop combinacional detectado!"
+            draw_text(screen, warning, (width // 2 - gate_font.size(warning)[0] // 2, height * 0.12), gate_font, (200, 50, 50))
+        profiler.lap("gate_draw")
         
-        ports = {"TERMINAL_I": self.inputs, "TERMINAL_O": self.outputs, "GATE": self.gates}
-        for wire in self.wires:
-            wire.update(ports)
-            wire.draw(screen, ports)
+        self.draw_wires(screen, view)
         
         if self.current_wire:
-            self.current_wire.draw_one_point(screen, ports, mouse_pos)
+            from_pos, to_pos = self.current_wire_ends(mouse_pos)
+            color = green if self.current_wire.value else wire_color_false
+            pygame.draw.line(screen, color, from_pos, to_pos, max(1, round(5 * zoom)))
+
+        hover = self.screen_hover()
+        if hover:
+            pygame.draw.circle(screen, hover_outline, hover[0], hover[1], 2)
         
 
+    def draw_wires(self, screen, view):
+        size = screen.get_size()
+        key = (self.wire_version, self.wire_color_version, size, self.camera.state())
+        if self.wire_layer is None or self.wire_layer[0] != key:
+            layer = self.wire_layer[1] if self.wire_layer and self.wire_layer[1].get_size() == size else pygame.Surface(size, pygame.SRCALPHA)
+            layer.fill((0, 0, 0, 0))
+            to_screen = self.camera.to_screen
+            line_width = max(1, round(5 * self.camera.zoom))
+            for wire, a, b in self.visible_wires(view):
+                pygame.draw.line(layer, wire.color, to_screen(a), to_screen(b), line_width)
+            self.wire_layer = (key, layer)
+            profiler.lap("wire_update")
+        screen.blit(self.wire_layer[1], (0, 0))
+        profiler.lap("wire_draw")
+
+    def screen_regions(self, width, height, mouse_pos, selected=None):
+        # What draw() puts on screen, as {key: (rect, state)}: anything whose
+        # state or rect differs from the previous frame has to be repainted.
+        # selected is the gate being dragged, which is drawn highlighted
+        regions = {}
+        camera = self.camera
+        to_screen = camera.to_screen
+        zoom = camera.zoom
+        view = camera.viewport(width, height, CULL_MARGIN)
+        panel_height = int(height * 0.16)
+        regions["palette"] = (pygame.Rect(0, height - panel_height - 5, width, panel_height + 5), tuple(self.allowed_gates.items()))
+        if self.instructions_panel is not None:
+            key, panel = self.instructions_panel
+            regions["instructions"] = (panel.get_rect(center=(width // 2, int(height * 0.75))), key)
+
+        outer = max(1, round(12 * zoom))
+        for term in self.inputs:
+            if view.collidepoint(term.pos):
+                x, y = to_screen(term.pos)
+                rect = pygame.Rect(terminal_label_pos(term, to_screen), get_font('arial', 20).size(f"{term.value}"))
+                regions[("TERMINAL_I", term.i)] = (rect.union((x - outer, y - outer, 2 * outer + 1, 2 * outer + 1)), (term.value, zoom))
+        for term in self.outputs:
+            if view.collidepoint(term.pos):
+                x, y = to_screen(term.pos)
+                rect = pygame.Rect(x - 12, y - 13, max(width - x, 0) + 12, 30)
+                regions[("TERMINAL_O", term.i)] = (rect.union((x - outer, y - outer, 2 * outer + 1, 2 * outer + 1)),
+                                                   (term.value, self.expected[term.i], zoom))
+
+        looped = {gid for loop in self.loops for gid in loop}
+        for gate in self.visible_gates(view):
+            state = (gate.type, gate.position, gate.id in looped, gate is selected, zoom,
+                     tuple(term.value for term in gate.inputs), tuple(term.value for term in gate.outputs))
+            regions[("GATE", gate.id)] = (camera.rect_to_screen(gate.bounds()), state)
+        if self.loops:
+            regions["loop_warning"] = (pygame.Rect(0, int(height * 0.12), width, 30), None)
+
+        key = (self.wire_version, self.wire_color_version, camera.state(), width, height)
+        if self.wire_regions is None or self.wire_regions[0] != key:
+            wire_regions = {}
+            line_width = max(1, round(5 * zoom))
+            for wire, a, b in self.visible_wires(view):
+                from_pos, to_pos = to_screen(a), to_screen(b)
+                wire_regions[("WIRE", wire.from_i, wire.to_i)] = (line_bounds(from_pos, to_pos, line_width), (from_pos, to_pos, wire.color))
+            self.wire_regions = (key, wire_regions)
+        regions.update(self.wire_regions[1])
+        if self.current_wire:
+            from_pos, to_pos = self.current_wire_ends(mouse_pos)
+            regions["current_wire"] = (line_bounds(from_pos, to_pos, max(1, round(5 * zoom))), (from_pos, to_pos, self.current_wire.value))
+        hover = self.screen_hover()
+        if hover:
+            (x, y), r = hover
+            regions["hover"] = (pygame.Rect(x - r - 1, y - r - 1, 2 * r + 3, 2 * r + 3), hover)
+        return regions
+
     def terminal_has_two_wires(self, i):
-        for wire in self.wires:
-            if wire.to_i[1] == "TERMINAL_O" and wire.to_i[0] == i:
-                return True
-        return False
+        return (i, "TERMINAL_O", 0) in self.fanin
 
     def gate_has_two_wires(self, gate_i, i):
-        for wire in self.wires:
-            if wire.to_i[1] == "GATE_I" and wire.to_i[0] == gate_i:
-                if wire.to_i[2] == i:
-                    return True
-        return False
+        return (gate_i, "GATE_I", i) in self.fanin
     
     def cycle_inputs(self, forward=True):
         n = len(self.inputs)
@@ -504,98 +1516,131 @@ class Level:
             next_val = (current + 1) % (2 ** n)
         else:
             next_val = (current - 1) % (2 ** n)
-        for i in range(n):
-            self.inputs[i].value = bool((next_val >> (n - i - 1)) & 1)
+        self.set_inputs([bool((next_val >> (n - i - 1)) & 1) for i in range(n)])
     
+    def packed_expected_table(self):
+        if self.packed_expected is None:
+            self.packed_expected = pack_truth_table(self.function, len(self.inputs), len(self.outputs))
+        return self.packed_expected
+
     def evaluate(self):
+        # Bit-parallel check: bit r of every packed int is row r of the truth
+        # table, so the whole table is verified in one pass over the circuit.
+        self.first_failure = None
         if self.current_function is None:
             return False
         n = len(self.inputs)
-        for i in range(2 ** n):
-            x = [(i >> bit) & 1 == 1 for bit in range(n)]
-            expected = self.function(x)
-            actual = self.current_function(x)
-            if expected != actual:
-                return False
+        mask = (1 << (1 << n)) - 1
+        expected = self.packed_expected_table()
+        actual = self.current_packed_function(packed_input_columns(n), mask)
+
+        diff = 0
+        for exp, act in zip(expected, actual):
+            diff |= exp ^ act
+        if diff:
+            row = (diff & -diff).bit_length() - 1
+            x = [(row >> bit) & 1 == 1 for bit in range(n)]
+            self.first_failure = {"row": row, "inputs": x, "expected": self.function(x), "actual": self.current_function(x)}
+            return False
         return True
 
     def compile(self):
-        var_map = {}
-        expr_map = {}
-        custom_gate_funcs = {}
-
-        for i in range(len(self.inputs)):
-            var_map[("TERMINAL_I", i)] = f"x[{i}]"
-
-        for gid in self.gates:
-            var_map[("GATE_O", gid, 0)] = f"g{gid}"
+        self.levelize()
+        if self.loops:
+            self.current_function = None
+            self.current_packed_function = None
+            raise CombinationalLoopError(self.loops)
+
+        self.current_function = self.cached_function("scalar")
+        self.current_packed_function = self.cached_function("packed")
+
+    def compile_batch(self):
+        # Vectorized target: takes a boolean matrix of shape (batch, n_inputs)
+        # and returns one of shape (batch, n_outputs).
+        np = _import_numpy()
+        self.levelize()
+        if self.loops:
+            raise CombinationalLoopError(self.loops)
+
+        logic_func = self.cached_function("numpy")
+        n_inputs = len(self.inputs)
+        n_outputs = len(self.outputs)
 
-        for i in range(len(self.outputs)):
-            var_map[("TERMINAL_O", i)] = f"y{i}"
+        def batch_func(x):
+            x = np.asarray(x, dtype=bool).reshape(-1, n_inputs)
+            false = np.zeros(x.shape[0], dtype=bool)
+            if n_outputs == 0:
+                return np.zeros((x.shape[0], 0), dtype=bool)
+            return np.column_stack(logic_func([x[:, i] for i in range(n_inputs)], false))
+
+        self.current_batch_function = batch_func
+        return batch_func
+
+    def build_function(self, target):
+        # Emits straight-line code: every gate in the output cones is assigned
+        # to a temporary exactly once, in topological order, and reused by all
+        # of its readers, so the code stays linear in the number of gates.
+        ops = compile_targets[target]
+        custom_gate_funcs = {}
+        source_functions = []
 
-        input_sources = {}
-        for wire in self.wires:
-            if wire.to_i[1] == "GATE_I":
-                input_sources[(wire.to_i[0], wire.to_i[2])] = wire.from_i
-            elif wire.to_i[1] == "TERMINAL_O":
-                input_sources[("OUT", wire.to_i[0])] = wire.from_i
+        input_sources = self.drivers
 
-        def build_expr_for_gate(gid, output_idx=0):
-            gate = self.gates[gid]
-            input_exprs = []
-            for i in range(len(gate.inputs)):
-                src = input_sources.get((gid, i))
-                if src is None:
-                    input_exprs.append("False")
-                elif src[1] == "TERMINAL_I":
-                    input_exprs.append(var_map[(src[1], src[0])])
-                elif src[1] == "GATE_O":
-                    input_exprs.append(build_expr_for_gate(src[0], src[2] if len(self.gates[src[0]].outputs) > 1 else 0))
-                else:
-                    input_exprs.append("False")
-            t = gate.type
-            if t == "AND":
-                expr = f"({' and '.join(input_exprs)})"
-            elif t == "OR":
-                expr = f"({' or '.join(input_exprs)})"
-            elif t == "NOT":
-                expr = f"(not {input_exprs[0]})"
-            elif t == "NAND":
-                expr = f"(not ({' and '.join(input_exprs)}))"
-            elif t == "NOR":
-                expr = f"(not ({' or '.join(input_exprs)}))"
-            elif t == "XOR":
-                expr = f"({input_exprs[0]} != {input_exprs[1]})"
-            elif t == "XNOR":
-                expr = f"({input_exprs[0]} == {input_exprs[1]})"
-            else:
-                func_name = f"custom_func_{gid}"
-                custom_gate_funcs[func_name] = gate.function
-                inputs_str = ", ".join(input_exprs)
-                expr = f"{func_name}([{inputs_str}])[{output_idx}]"
-            expr_map[(gid, output_idx)] = expr
-            return expr
-
-        output_exprs = []
-        for i in range(len(self.outputs)):
-            src = input_sources.get(("OUT", i))
+        def source_expr(src):
             if src is None:
-                output_exprs.append("False")
+                return ops["FALSE"]
             elif src[1] == "TERMINAL_I":
-                output_exprs.append(var_map[(src[1], src[0])])
+                return f"x[{src[0]}]"
             elif src[1] == "GATE_O":
-                output_exprs.append(build_expr_for_gate(src[0], src[2] if len(self.gates[src[0]].outputs) > 1 else 0))
+                return f"g{src[0]}_{src[2]}"
+            return ops["FALSE"]
+
+        # Only gates that reach an output are emitted
+        needed = set()
+        stack = [src[0] for key, src in input_sources.items() if key[1] == "TERMINAL_O" and src[1] == "GATE_O"]
+        while stack:
+            gid = stack.pop()
+            if gid in needed:
+                continue
+            needed.add(gid)
+            for i in range(len(self.gates[gid].inputs)):
+                src = input_sources.get((gid, "GATE_I", i))
+                if src is not None and src[1] == "GATE_O":
+                    stack.append(src[0])
+
+        func_lines = [f"def logic_func({ops['ARGS']}):"]
+        body_lines = []
+        for gid in self.levelize():
+            if gid not in needed:
+                continue
+            gate = self.gates[gid]
+            input_exprs = [source_expr(input_sources.get((gid, "GATE_I", i))) for i in range(len(gate.inputs))]
+            if gate.type in ops:
+                body_lines.append(f"    g{gid}_0 = {ops[gate.type](input_exprs)}")
             else:
-                output_exprs.append("False")
+                func_name = f"custom_func_{gid}"
+                custom_gate_funcs[func_name] = ops["CUSTOM"](gate)
+                source_functions.append(gate.function)
+                body_lines.append(f"    t{gid} = {ops['CALL'](func_name, input_exprs)}")
+                for j in range(len(gate.outputs)):
+                    body_lines.append(f"    g{gid}_{j} = t{gid}[{j}]")
+
+        output_exprs = [source_expr(input_sources.get((i, "TERMINAL_O", 0))) for i in range(len(self.outputs))]
 
-        body = f"return [{', '.join(output_exprs)}]"
-        func_lines = ["def logic_func(x):"]
         for func_name in custom_gate_funcs:
             func_lines.append(f"    {func_name} = __custom_funcs__['{func_name}']")
-        func_lines.append(f"    {body}")
+        func_lines.extend(body_lines)
+        func_lines.append(f"    return [{', '.join(output_exprs)}]")
 
         func_str = "\n".join(func_lines)
         local_ns = {}
         global_ns = {"__custom_funcs__": custom_gate_funcs}
+        if "GLOBALS" in ops:
+            global_ns.update(ops["GLOBALS"]())
         exec(func_str, global_ns, local_ns)
-        self.current_function = local_ns["logic_func"]
+        logic_func = local_ns["logic_func"]
+        logic_func.source = func_str
+        # Keeps custom gate functions alive while cached, since their id() is
+        # part of the structural hash
+        logic_func.source_functions = source_functions
+        return logic_func
@@ -1,7 +1,10 @@
 import pygame
 import sys
-from ui import Button, draw_background, draw_success_message, draw_failure_message, draw_run_button, draw_truth_table_button, draw_quit_button, draw_reset_button
-from logic import Gate, Wire, Level, resource_path
+import os
+from ui import Button, DirtyRegions, FrameScheduler, profiler, get_font, prewarm_fonts, get_image, preload_images, evict_scaled_images, draw_background, draw_success_message, draw_failure_message, draw_run_button, draw_truth_table_button, draw_quit_button, draw_reset_button
+from logic import Wire, Level, CombinationalLoopError, resource_path, default_gates
+from levels import levels, logic_gates
+from circuit_io import save_circuit, read_circuit
 import math
 import time
 
@@ -9,13 +12,12 @@ import time
 # pyinstaller --onefile --noconsole --add-data "images;images" main.py
 
 
-# Pygame setup
-pygame.init()
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_icon(pygame.image.load(resource_path("icon.ico")))
-pygame.display.set_caption("Logic Gate Puzzle")
-clock = pygame.time.Clock()
+
+# Display, frame scheduler and fonts are created by init_display(), so importing this
+# module has no side effects
+screen = None
+frames = None
 
 # Colors & Fonts
 background_color = (80, 80, 80)
@@ -26,90 +28,68 @@ hover_color = (50, 200, 50)
 button_bg = (40, 40, 40)
 panel_bg = (50, 50, 50)
 
+# Scrolling background; when off, play_level repaints only what changed
+animated_background = True
+
 def get_scaled_font(name, size_ratio):
-    return pygame.font.SysFont(name, int(HEIGHT * size_ratio))
-
-title_font = get_scaled_font('arialrounded', 0.1)
-menu_font = get_scaled_font('arial', 0.04)
-gate_font = get_scaled_font('arial', 0.035)
-terminal_font = get_scaled_font('arial', 0.015)
-
-def level0_function(inputs):
-    return [inputs[0]]
-
-def level1_function(inputs):
-    return [not inputs[0]]
-
-def level2_function(inputs):
-    return [inputs[0] or inputs[1]]
-
-def level3_function(inputs):
-    return [inputs[0] and inputs[1]]
-
-def level4_function(inputs):
-    return [not(inputs[0] or inputs[1])]
-
-def level5_function(inputs):
-    return [not(inputs[0] and inputs[1])]
-
-def level6_function(inputs):
-    return [True if inputs[0] != inputs[1] else False]
-
-def level7_function(inputs):
-    return [False if inputs[0] != inputs[1] else True]
-
-def level8_function(inputs):
-    sum_bit = inputs[0] ^ inputs[1]
-    carry_out = inputs[0] and inputs[1]
-    return [sum_bit, carry_out]
-
-def level9_function(inputs):
-    sum_bit = (inputs[0] ^ inputs[1]) ^ inputs[2]
-    carry_out = (inputs[0] and inputs[1]) or (inputs[1] and inputs[2]) or (inputs[0] and inputs[2])
-    return [sum_bit, carry_out]
-
-def gate_half_adder(inputs):
-    sum_bit = inputs[0] ^ inputs[1]
-    carry_out = inputs[0] and inputs[1]
-    return [sum_bit, carry_out]
-
-def level10_function(inputs):
-    diff = inputs[0] ^ inputs[1]
-    borrow = (not inputs[0]) and inputs[1]
-    return [diff, borrow]
-
-def level11_function(inputs):
-    diff = (inputs[0] ^ inputs[1]) ^ inputs[2]
-    borrow = ((not inputs[0]) and inputs[1]) or ((not inputs[0]) and inputs[2]) or (inputs[1] and inputs[2])
-    return [diff, borrow]
-
-
-levels = [  Level("INTRO", 1, {}, level0_function, "Bem vindo ao jogo de Lógica Digital! Neste jogo, você irá aprender sobre portas lógicas e como elas funcionam. Para começar clique o botão direito do mouse no terminal de entrada e depois no de saída. Para finalizar o nível aperte Enter ou clique no botão de executar."),
-            Level("NOT", 1, {'NOT': 1}, level1_function, "Agora vamos aprender sobre a porta NOT. Ela inverte o valor de entrada. Clique e arraste a porta NOT para o circuito, conecte-a ao terminal de entrada e depois ao terminal de saída. Para finalizar o nível aperte Enter ou clique no botão de executar."),
-            Level("OR", 2, {'OR': 1}, level2_function, "A porta OR retorna verdadeiro se pelo menos uma entrada for verdadeira. Caso você queira saber a tabela verdade de uma porta lógica, aperte a tecla T ou clique no botão de tabela verdade."),
-            Level("AND", 2, {'AND': 1}, level3_function, "A porta AND retorna verdadeiro se todas as entradas forem verdadeiras."),
-            Level("NOR", 2, {'OR': 1, 'NOT': 1}, level4_function, "A porta NOR é a combinação da porta OR com a NOT. Ela retorna verdadeiro apenas se todas as entradas forem falsas."),
-            Level("NAND", 2, {'AND': 1, 'NOT': 1}, level5_function, "A porta NAND é a combinação da porta AND com a NOT. Ela retorna verdadeiro se pelo menos uma entrada for falsa. Você pode usar a porta NAND para criar todas as outras portas lógicas."),
-            Level("OR - NAND", 2, {'NAND': 3}, level2_function, "Neste nível, você deve usar apenas portas NAND para criar uma porta OR."),
-            Level("XOR", 2, {'OR': 1, 'AND': 2, 'NOT': 2}, level6_function, "Agora vamos aprender sobre a porta XOR. Ela retorna verdadeiro se apenas uma das entradas for verdadeira."),
-            Level("XNOR", 2, {'XOR': 1, 'NOT': 1}, level7_function, "A porta XNOR é a combinação da porta XOR com a NOT. Ela retorna verdadeiro se as entradas forem iguais."),
-            Level("HALF ADDER", 2, {'XOR': 1, 'AND': 1}, level8_function, "Neste nível, você deve usar uma porta XOR e uma porta AND para criar um somador de meio bit (half adder). O somador de meio bit recebe duas entradas e retorna a soma e o carry."),
-            Level("FULL ADDER", 3, {'XOR': 2, 'AND': 2, 'OR': 1}, level9_function, "Neste nível, você deve usar duas portas XOR, duas portas AND e uma porta OR para criar um somador completo (full adder). O somador completo recebe três entradas: A, B e Cin (carry in) e retorna a soma e o carry out."),
-            Level("FULL ADDER 2", 3, {'OR': 1, 'HALF ADDER': 2}, level9_function, "Neste nível, você deve usar duas portas HALF ADDER e uma porta OR para criar um somador completo (full adder)."),
-            Level("HALF SUBT", 2, {'XOR': 1, 'AND': 1, 'NOT': 1}, level10_function, "Neste nível, você deve usar uma porta XOR, uma porta AND e uma porta NOT para criar um subtrator de meio bit (half subtractor). O subtrator de meio bit recebe duas entradas e retorna a diferença e o borrow."),
-            Level("FULL SUBT", 3, {'NOT': 2, 'XOR': 2, 'AND': 2, 'OR': 1}, level11_function, "Neste nível, você deve criar um subtrator completo (full subtractor). O subtrator completo recebe três entradas: A, B e Bin (borrow in) e retorna a diferença e o borrow out."),
-        ]
-
-logic_gates = {
-    'AND': Gate('AND', 2, 1, (0, 0)),
-    'OR': Gate('OR', 2, 1, (0, 0)),
-    'NOT': Gate('NOT', 1, 1, (0, 0)),
-    'XOR': Gate('XOR', 2, 1, (0, 0)),
-    'NAND': Gate('NAND', 2, 1, (0, 0)),
-    'NOR': Gate('NOR', 2, 1, (0, 0)),
-    "XNOR": Gate("XNOR", 2, 1, (0, 0)),
-    'HALF ADDER': Gate('HALF ADDER', 2, 2, (0, 0), gate_half_adder),
-}
+    return get_font(name, int(HEIGHT * size_ratio))
+
+title_font = menu_font = gate_font = terminal_font = None
+
+def init_display():
+    global screen, frames, title_font, menu_font, gate_font, terminal_font
+    # Pygame setup
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_icon(pygame.image.load(resource_path("icon.ico")))
+    pygame.display.set_caption("Logic Gate Puzzle")
+    frames = FrameScheduler()
+    preload_images([gate[0] for gate in default_gates.values()] + [resource_path("images//reset.png"), resource_path("images/trash.png")])
+
+    # Load every font the game draws with up front instead of on the first
+    # frame that needs it
+    prewarm_fonts([('arial', 10), ('arial', 14), ('arial', 16), ('arial', 18), ('arial', 20),
+                   ('arial', int(HEIGHT * 0.08))])
+    title_font = get_scaled_font('arialrounded', 0.1)
+    menu_font = get_scaled_font('arial', 0.04)
+    gate_font = get_scaled_font('arial', 0.035)
+    terminal_font = get_scaled_font('arial', 0.015)
+
+def check_solution(level):
+    try:
+        level.compile()
+    except CombinationalLoopError:
+        return False
+    return level.evaluate()
+
+def save_path(level):
+    return os.path.join("saves", f"{level.name}.json")
+
+def load_saved_circuit(level):
+    path = save_path(level)
+    if not os.path.exists(path):
+        return False
+    # Nothing changes until the file is read and fits this level, so a bad
+    # save leaves the current circuit in place
+    try:
+        gates, wires = read_circuit(level, path)
+    except (OSError, ValueError):
+        return False
+    # The level's limits: what is left plus what is already placed
+    limits = dict(level.allowed_gates)
+    for gate in level.gates.values():
+        limits[gate.type] += 1
+    used = {}
+    for gate in gates.values():
+        used[gate.type] = used.get(gate.type, 0) + 1
+    # Saved circuit uses gates this level does not offer, or too many of them
+    if any(gt not in limits or (limits[gt] != -1 and n > limits[gt]) for gt, n in used.items()):
+        return False
+    level.reset()
+    level.load_circuit(gates, wires)
+    for gate in gates.values():
+        level.allowed_gates[gate.type] -= 1
+    return True
 
 def play_level(screen, level):
     width, height = pygame.display.get_window_size()
@@ -117,6 +97,9 @@ def play_level(screen, level):
     dragging = None
     wiring = None
     offset = (0, 0)
+    # Middle-button drag pans the circuit, the wheel zooms it
+    camera = level.camera
+    panning = None
 
     palette_height = int(height * 0.15)
     gate_radius = int(width * 0.01)
@@ -138,65 +121,125 @@ def play_level(screen, level):
     run_btn_rect = pygame.Rect(run_pos[0], run_pos[1], button_size, button_size)
 
 
-    anim_start = time.time()
-    while True:
-        bg_offset = int((time.time() - anim_start) * 20) % height
-        draw_background(screen, background_color, bg_offset)
+    # F3 shows the frame profiler, F4 writes its samples to a CSV file
+    profiler_pos = (quit_pos[0], quit_pos[1] + button_size + 10)
 
-        mouse_pos = pygame.mouse.get_pos()
+    def draw_scene():
+        bg_offset = int((time.time() - anim_start) * 20) % height if animated_background else 0
+        draw_background(screen, background_color, bg_offset)
+        profiler.lap("background")
 
         level.draw(screen, width, height, mouse_pos)
 
-        quit_btn_hover = quit_btn_rect.collidepoint(mouse_pos)
         draw_quit_button(screen, quit_pos, (100, 25, 25), button_size, quit_btn_hover)
-
-        reset_btn_hover = reset_btn_rect.collidepoint(mouse_pos)
         draw_reset_button(screen, reset_pos, (170, 170, 170), button_size, reset_btn_hover, resource_path("images//reset.png"))
 
         if not level.isSimulator:
-            truth_btn_hover = truth_btn_rect.collidepoint(mouse_pos)
             draw_truth_table_button(screen, truth_pos, (170, 170, 170), button_size, truth_btn_hover)
             if truth_table:
                 level.draw_truth_table(screen, width, height)
         
-            run_btn_hover = run_btn_rect.collidepoint(mouse_pos)
             draw_run_button(screen, run_pos, green, button_size, run_btn_hover)
 
-
         if dragging:
             palette_rect = pygame.Rect(0, height - palette_height, width, palette_height)
             pygame.draw.rect(screen, background_color, palette_rect)
 
-            if not hasattr(play_level, "_trash_icon") or play_level._trash_icon_size != width // 8:
-                trash_img = pygame.image.load(resource_path("images/trash.png")).convert_alpha()
-                trash_img = pygame.transform.scale(trash_img, (width // 8, width // 8))
-                play_level._trash_icon = trash_img
-                play_level._trash_icon_size = width // 8
-            else:
-                trash_img = play_level._trash_icon
-            
+            trash_img = get_image(resource_path("images/trash.png"), (width // 8, width // 8))
             screen.blit(trash_img, (width // 2 - width // 16, height - palette_height))
 
-            dragging.position = (mouse_pos[0] + offset[0], mouse_pos[1] + offset[1])
-            dragging.udpate_terminal_positions()
-            dragging.draw(screen, selected=True)
+            x, y = camera.to_screen(dragging.position)
+            dragging.draw(screen, x, y, selected=True, zoom=camera.zoom)
+        profiler.lap("ui")
 
-        pygame.display.flip()
+        if profiler.enabled:
+            profiler.draw(screen, profiler_pos)
+            profiler.lap("profiler")
+
+    # With a static background only what changed since the last frame is
+    # repainted and pushed to the display; the animated one scrolls every
+    # pixel, so it always takes the full redraw.
+    regions = DirtyRegions()
+    anim_start = time.time()
+    while True:
+        profiler.frame()
+        mouse_pos = pygame.mouse.get_pos()
+        if panning:
+            camera.pan(mouse_pos[0] - panning[0], mouse_pos[1] - panning[1])
+            panning = mouse_pos
+        # Circuit coordinates under the cursor; pick radii stay in screen pixels
+        world_pos = camera.to_world(mouse_pos)
+        pick_gate, pick_terminal = gate_radius / camera.zoom, terminal_radius / camera.zoom
+
+        # Only does work while a change is still settling
+        level.propagate()
 
-        for e in pygame.event.get():
+        if dragging:
+            level.move_gate(dragging, (world_pos[0] + offset[0], world_pos[1] + offset[1]))
+        level.update_hover(world_pos, pick_gate, pick_terminal)
+        profiler.lap("gate_update")
+
+        quit_btn_hover = quit_btn_rect.collidepoint(mouse_pos)
+        reset_btn_hover = reset_btn_rect.collidepoint(mouse_pos)
+        truth_btn_hover = truth_btn_rect.collidepoint(mouse_pos)
+        run_btn_hover = run_btn_rect.collidepoint(mouse_pos)
+
+        if animated_background:
+            dirty = None
+        else:
+            items = level.screen_regions(width, height, mouse_pos, dragging)
+            items["quit"] = (quit_btn_rect, quit_btn_hover)
+            items["reset"] = (reset_btn_rect, reset_btn_hover)
+            if not level.isSimulator:
+                items["truth_button"] = (truth_btn_rect, truth_btn_hover)
+                items["run"] = (run_btn_rect, run_btn_hover)
+                if truth_table:
+                    # Redrawn on scrolling and whenever the circuit's own column changes
+                    actual = level.packed_actual_table()
+                    items["truth_table"] = (None, (level.truth_table_scroll, actual and actual[0]))
+            if dragging:
+                items["trash"] = (pygame.Rect(0, height - palette_height, width, palette_height), None)
+                # Drawn again on top of the trash, so also tracked when culled
+                items["dragging"] = (camera.rect_to_screen(dragging.bounds()), None)
+            if profiler.enabled:
+                items["profiler"] = (profiler.overlay_rect(profiler_pos), profiler.frames)
+            dirty = regions.collect(items)
+        profiler.lap("dirty_rects")
+
+        if dirty is None:
+            draw_scene()
+            pygame.display.flip()
+        elif dirty:
+            for rect in dirty:
+                screen.set_clip(rect)
+                draw_scene()
+            screen.set_clip(None)
+            pygame.display.update(dirty)
+        profiler.lap("flip")
+
+        # Full rate while dragging or wiring; a still scene sleeps until input
+        events = frames.events(interactive=bool(dragging or wiring or panning), animating=animated_background or bool(level.pending))
+        profiler.lap("wait")
+        for e in events:
             if e.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif e.type == pygame.VIDEORESIZE:
                 WIDTH, HEIGHT = e.w, e.h
                 screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+                evict_scaled_images()
+                regions.invalidate()
+            elif e.type == pygame.MOUSEWHEEL:
+                if truth_table:
+                    level.scroll_truth_table(-e.y * 3)
+                else:
+                    camera.zoom_at(mouse_pos, e.y)
             elif e.type == pygame.MOUSEBUTTONDOWN:
                 if e.button == 1 :
                     if not dragging and not wiring:
                         if not level.isSimulator:
                             if run_btn_hover:
-                                level.compile()
-                                if level.evaluate():
+                                if check_solution(level):
                                     level.completed = True
                                     draw_success_message(screen, width, height, get_scaled_font('arial', 0.08), green)
                                     pygame.display.flip()
@@ -206,6 +249,7 @@ def play_level(screen, level):
                                     draw_failure_message(screen, width, height, get_scaled_font('arial', 0.08), (200, 50, 50))
                                     pygame.display.flip()
                                     pygame.time.wait(2500)
+                                    regions.invalidate()
                                     break
                             elif truth_btn_hover:
                                 truth_table = not truth_table
@@ -226,92 +270,74 @@ def play_level(screen, level):
                                 if level.allowed_gates[gt] == 0:
                                     continue
                                 new_gate = logic_gates[gt].copy()
-                                new_gate.position = mouse_pos
+                                new_gate.position = world_pos
                                 level.add_gate(new_gate)
                                 level.allowed_gates[gt] -= 1
                                 dragging = new_gate
-                                offset = (new_gate.position[0] - mouse_pos[0], new_gate.position[1] - mouse_pos[1])
-                                break
-                        for gate in level.gates.values():
-                            if (mouse_pos[0] - gate.position[0])**2 + (mouse_pos[1] - gate.position[1])**2 < gate.radius**2:
-                                dragging = gate
-                                offset = (gate.position[0] - mouse_pos[0], gate.position[1] - mouse_pos[1])
-                                break
-                        for term in level.inputs:
-                            if (mouse_pos[0] - term.pos[0])**2 + (mouse_pos[1] - term.pos[1])**2 < terminal_radius**2:
-                                term.value = not term.value
+                                offset = (0, 0)
                                 break
+                        gate = level.gate_at(world_pos)
+                        if gate:
+                            dragging = gate
+                            offset = (gate.position[0] - world_pos[0], gate.position[1] - world_pos[1])
+                        hit = level.endpoint_at(world_pos, pick_terminal, ("TERMINAL_I",))
+                        if hit:
+                            level.set_input(hit[0], not level.inputs[hit[0]].value)
+                elif e.button == 2:
+                    panning = mouse_pos
                 elif e.button == 3 and not dragging:
-                    def check_terminal(term, kind, idx, attr):
-                        if (mouse_pos[0] - term.pos[0])**2 + (mouse_pos[1] - term.pos[1])**2 < terminal_radius**2:
+                    clicked = False
+                    hit = (level.endpoint_at(world_pos, pick_terminal, ("TERMINAL_I", "TERMINAL_O"))
+                           or level.endpoint_at(world_pos, pick_gate, ("GATE_I", "GATE_O")))
+                    if hit:
+                        idx, kind, pin = hit
+                        # Input terminals
+                        if kind == "TERMINAL_I":
+                            term = level.inputs[idx]
                             if not wiring:
-                                wire = Wire((term.i, kind, idx), None, getattr(term, attr, None))
-                                level.current_wire = wire
-                                return wire
+                                wiring = Wire(hit, None, term.value)
+                                level.current_wire = wiring
                             elif not wiring.from_i:
-                                wiring.from_i = (term.i, kind, idx)
-                                wiring.value = getattr(term, attr, None)
-                                return wiring
-                            return wiring
-                        return None
-
-                    clicked = False
-                    # Input terminals
-                    for term in level.inputs:
-                        if check_terminal(term, "TERMINAL_I", 0, "value"):
-                            wiring = level.current_wire
+                                wiring.from_i = hit
+                                wiring.value = term.value
                             clicked = True
-                            break
-                    # Output terminals
-                    if not clicked:
-                        for term in level.outputs:
-                            if (mouse_pos[0] - term.pos[0])**2 + (mouse_pos[1] - term.pos[1])**2 < terminal_radius**2:
-                                if not level.terminal_has_two_wires(term.i):
-                                    if not wiring:
-                                        wiring = Wire(None, (term.i, "TERMINAL_O", 0), term.value)
-                                        level.current_wire = wiring
-                                    elif not wiring.to_i:
-                                        wiring.to_i = (term.i, "TERMINAL_O", 0)
+                        # Output terminals
+                        elif kind == "TERMINAL_O":
+                            if not level.terminal_has_two_wires(idx):
+                                if not wiring:
+                                    wiring = Wire(None, hit, level.outputs[idx].value)
+                                    level.current_wire = wiring
+                                elif not wiring.to_i:
+                                    wiring.to_i = hit
+                            clicked = True
+                        # Gate terminals
+                        elif kind == "GATE_I":
+                            if not level.gate_has_two_wires(idx, pin):
+                                if not wiring:
+                                    wiring = Wire(None, hit)
+                                    level.current_wire = wiring
+                                elif not wiring.to_i:
+                                    wiring.to_i = hit
                                 clicked = True
-                                break
-                    # Gate terminals
-                    if not clicked:
-                        for gate in level.gates.values():
-                            # Inputs
-                            for i, pos in gate.get_input_positions():
-                                if (mouse_pos[0] - pos[0])**2 + (mouse_pos[1] - pos[1])**2 < gate_radius**2:
-                                    if not level.gate_has_two_wires(gate.id, i):
-                                        if not wiring:
-                                            wiring = Wire(None, (gate.id, "GATE_I", i))
-                                            level.current_wire = wiring
-                                        elif not wiring.to_i:
-                                            wiring.to_i = (gate.id, "GATE_I", i)
-                                        clicked = True
-                                        break
-                            if clicked:
-                                break
-                            # Outputs
-                            for i, pos, _ in gate.get_output_positions():
-                                if (mouse_pos[0] - pos[0])**2 + (mouse_pos[1] - pos[1])**2 < gate_radius**2:
-                                    if not wiring:
-                                        wiring = Wire((gate.id, "GATE_O", i), None, gate.outputs[i].value)
-                                        level.current_wire = wiring
-                                    elif not wiring.from_i:
-                                        wiring.from_i = (gate.id, "GATE_O", i, gate.outputs[i].value)
-                                    clicked = True
-                                    break
-                            if clicked:
-                                break
+                        else:
+                            if not wiring:
+                                wiring = Wire(hit, None, level.gates[idx].outputs[pin].value)
+                                level.current_wire = wiring
+                            elif not wiring.from_i:
+                                wiring.from_i = hit
+                            clicked = True
                     if not clicked and wiring:
                         wiring = None
                         level.current_wire = None
                         break
                     if wiring and wiring.from_i and wiring.to_i:
-                        level.wires.append(wiring)
+                        level.add_wire(wiring)
                         wiring = None
                         level.current_wire = None
             elif e.type == pygame.MOUSEBUTTONUP:
-                if e.button == 1 and dragging and dragging.position[1] > height - palette_height:
+                if e.button == 2:
+                    panning = None
+                elif e.button == 1 and dragging and camera.to_screen(dragging.position)[1] > height - palette_height:
                     level.remove_gate(dragging)
                     level.allowed_gates[dragging.type] += 1
                     dragging = None
@@ -329,18 +355,36 @@ def play_level(screen, level):
                         return
                 elif e.key == pygame.K_t:
                     truth_table = not truth_table
+                elif e.key == pygame.K_PAGEUP and truth_table:
+                    level.scroll_truth_table(-10)
+                elif e.key == pygame.K_PAGEDOWN and truth_table:
+                    level.scroll_truth_table(10)
                 elif e.key == pygame.K_LEFT or e.key == pygame.K_a:
                     level.cycle_inputs(False)
                 elif e.key == pygame.K_RIGHT or e.key == pygame.K_d:
                     level.cycle_inputs(True)
                 elif e.key == pygame.K_r:
                     level.reset()
+                elif e.key == pygame.K_HOME:
+                    camera.reset()
+                elif e.key == pygame.K_F3:
+                    profiler.toggle()
+                elif e.key == pygame.K_F4 and profiler.samples:
+                    os.makedirs("profiles", exist_ok=True)
+                    profiler.dump_csv(os.path.join("profiles", time.strftime("frames-%Y%m%d-%H%M%S.csv")))
+                elif e.key == pygame.K_s and e.mod & pygame.KMOD_CTRL:
+                    os.makedirs("saves", exist_ok=True)
+                    save_circuit(level, save_path(level))
+                elif e.key == pygame.K_o and e.mod & pygame.KMOD_CTRL:
+                    wiring = None
+                    dragging = None
+                    level.current_wire = None
+                    load_saved_circuit(level)
                 elif (e.key == pygame.K_RETURN or e.key == pygame.K_SPACE) and not level.isSimulator:
                     wiring = None
                     dragging = None
                     truth_table = False
-                    level.compile()
-                    if level.evaluate():
+                    if check_solution(level):
                         level.completed = True
                         draw_success_message(screen, width, height, get_scaled_font('arial', 0.08), green)
                         pygame.display.flip()
@@ -350,6 +394,7 @@ def play_level(screen, level):
                         draw_failure_message(screen, width, height, get_scaled_font('arial', 0.08), (200, 50, 50))
                         pygame.display.flip()
                         pygame.time.wait(2500)
+                        regions.invalidate()
                         break
                 elif e.key == pygame.K_BACKSPACE or e.key == pygame.K_DELETE:
                     if level.gates:
@@ -358,8 +403,6 @@ def play_level(screen, level):
                         level.remove_gate(last_gate)
                         level.allowed_gates[last_gate.type] += 1
                         
-        clock.tick(240)
-
 
 def history_menu():
     # Grid
@@ -394,12 +437,12 @@ def history_menu():
 
     selected = 1
     total_items = len(level_buttons) + 1
+    title_surf = title_font.render("História", True, white)
     anim_start = time.time()
     while True:
-        bg_offset = int((time.time() - anim_start) * 20) % HEIGHT
+        bg_offset = int((time.time() - anim_start) * 20) % HEIGHT if animated_background else 0
         draw_background(screen, background_color, bg_offset)
 
-        title_surf = title_font.render("História", True, white)
         screen.blit(title_surf, title_surf.get_rect(center=(WIDTH // 2, HEIGHT * 0.1)))
 
         mx, my = pygame.mouse.get_pos()
@@ -420,7 +463,9 @@ def history_menu():
 
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        # Hovered buttons bob, so the menu only idles when none is hovered
+        hovering = any(btn.is_mouse_over((mx, my)) for btn in level_buttons + [voltar_button])
+        for event in frames.events(animating=animated_background or hovering):
             if event.type == pygame.QUIT:
                 pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
@@ -445,9 +490,6 @@ def history_menu():
                     return None
                 else:
                     return play_level(screen, levels[selected])
-                
-
-        clock.tick(60)
 
 
 def simulator_menu():
@@ -456,20 +498,22 @@ def simulator_menu():
 
 
 def options_menu():
+    global animated_background
     fullscreen = False
+    title_surf = title_font.render("Opções", True, white)
+    labels = ["Tela Cheia: Off",
+              f"Fundo Animado: {'On' if animated_background else 'Off'}",
+              f"Economia de Bateria: {'On' if frames.battery_saver else 'Off'}",
+              "Voltar"]
+    buttons = [Button(label, menu_font, WIDTH//2, HEIGHT // 3 + HEIGHT * (0.1 + 0.13 * i), 50, button_bg, hover_color) for i, label in enumerate(labels)]
     anim_start = time.time()
     while True:
-        bg_offset = int((time.time() - anim_start) * 20) % HEIGHT
+        bg_offset = int((time.time() - anim_start) * 20) % HEIGHT if animated_background else 0
         draw_background(screen, background_color, bg_offset)
 
-        title_surf = title_font.render("Opções", True, white)
         screen.blit(title_surf, title_surf.get_rect(center=(WIDTH//2, 80)))
 
         mx, my = pygame.mouse.get_pos()
-        buttons = [
-            Button(f"Tela Cheia: {'On' if fullscreen else 'Off'}", menu_font, WIDTH//2, HEIGHT // 3 + (HEIGHT * 0.15), 50, button_bg, hover_color),
-            Button("Voltar", menu_font, WIDTH//2, HEIGHT // 3 + (HEIGHT * 0.3), 50, button_bg, hover_color)
-        ]
         selected = None
         t = time.time() - anim_start
         for i, btn in enumerate(buttons):
@@ -481,7 +525,7 @@ def options_menu():
 
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        for event in frames.events(animating=animated_background or selected is not None):
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -489,27 +533,39 @@ def options_menu():
                 if event.key == pygame.K_RETURN:
                     if selected == 0:
                         fullscreen = not fullscreen
+                        buttons[0].set_text(f"Tela Cheia: {'On' if fullscreen else 'Off'}")
                         if fullscreen:
                             pygame.display.set_mode((WIDTH, HEIGHT), pygame.FULLSCREEN)
                         else:
                             pygame.display.set_mode((WIDTH, HEIGHT))
+                    elif selected == 1:
+                        animated_background = not animated_background
+                        buttons[1].set_text(f"Fundo Animado: {'On' if animated_background else 'Off'}")
+                    elif selected == 2:
+                        frames.battery_saver = not frames.battery_saver
+                        buttons[2].set_text(f"Economia de Bateria: {'On' if frames.battery_saver else 'Off'}")
                     else:
                         return
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and selected is not None:
                 if selected == 0:
                     fullscreen = not fullscreen
+                    buttons[0].set_text(f"Tela Cheia: {'On' if fullscreen else 'Off'}")
                     if fullscreen:
                         pygame.display.set_mode((WIDTH, HEIGHT), pygame.FULLSCREEN)
                     else:
                         pygame.display.set_mode((WIDTH, HEIGHT))
                 elif selected == 1:
+                    animated_background = not animated_background
+                    buttons[1].set_text(f"Fundo Animado: {'On' if animated_background else 'Off'}")
+                elif selected == 2:
+                    frames.battery_saver = not frames.battery_saver
+                    buttons[2].set_text(f"Economia de Bateria: {'On' if frames.battery_saver else 'Off'}")
+                elif selected == 3:
                     return
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     return
 
-        clock.tick(60)
-
 
 def main_menu():
     options = ["Níveis", "Simulador", "Opções"]
@@ -517,13 +573,13 @@ def main_menu():
     selected = 0
 
     button_offsets = [0 for _ in buttons]
+    title_surf = title_font.render("Menu", True, white)
     anim_start = time.time()
 
     while True:
-        bg_offset = int((time.time() - anim_start) * 20) % HEIGHT
+        bg_offset = int((time.time() - anim_start) * 20) % HEIGHT if animated_background else 0
         draw_background(screen, background_color, bg_offset)
 
-        title_surf = title_font.render("Menu", True, white)
         screen.blit(title_surf, title_surf.get_rect(center=(WIDTH//2, HEIGHT // 8)))
 
         mx, my = pygame.mouse.get_pos()
@@ -541,7 +597,8 @@ def main_menu():
 
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        # The selected button always bobs
+        for event in frames.events(animating=True):
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -565,8 +622,7 @@ def main_menu():
                 else:
                     options_menu()
 
-        clock.tick(60)
-
 
 if __name__ == '__main__':
+    init_display()
     main_menu()
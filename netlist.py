@@ -0,0 +1,346 @@
+from array import array
+from collections import deque
+
+from logic import (Gate, Wire, GATE_RADIUS, FIELD, pin_offsets, terminal_position, find_combinational_loops, draw_terminal,
+                   green, wire_color_false)
+
+# Compact struct-of-arrays netlist for very large (sandbox) circuits, where
+# one Gate/Terminal/Wire object per pin costs more than the simulation.
+#
+# Every driver is a net: net 0 is the constant False, nets 1..n are the
+# input terminals and each gate output gets the next free one. Gates are
+# rows of parallel arrays (id, type code, position); the input pins of row
+# g are in_net[in_start[g]:in_start[g + 1]], the net driving each pin, and
+# its outputs are nets out_net[g], out_net[g] + 1, ... Net values live in
+# one bytearray.
+#
+# GateView, TerminalView and WireView expose the Gate/Terminal/Wire
+# interface over these buffers, so Gate.draw and Wire.draw work on them.
+
+builtin_ops = {
+    "AND": lambda v: all(v),
+    "OR": lambda v: any(v),
+    "NOT": lambda v: not v[0],
+    "NAND": lambda v: not all(v),
+    "NOR": lambda v: not any(v),
+    "XOR": lambda v: v[0] != v[1] if len(v) == 2 else False,
+    "XNOR": lambda v: v[0] == v[1] if len(v) == 2 else False,
+}
+
+
+class TerminalView:
+    __slots__ = ("netlist", "net", "i", "type", "pos", "isNot")
+
+    def __init__(self, netlist, net, i, type_, pos, isNot=False):
+        self.netlist = netlist
+        self.net = net
+        self.i = i
+        self.type = type_
+        self.pos = pos
+        self.isNot = isNot
+
+    @property
+    def value(self):
+        return bool(self.netlist.values[self.net])
+
+
+class GateView:
+    __slots__ = ("netlist", "row")
+
+    radius = GATE_RADIUS
+    draw = Gate.draw
+    sprite = Gate.sprite
+    bounds = Gate.bounds
+    get_input_positions = Gate.get_input_positions
+    get_output_positions = Gate.get_output_positions
+
+    def __init__(self, netlist, row):
+        self.netlist = netlist
+        self.row = row
+
+    @property
+    def id(self):
+        return self.netlist.ids[self.row]
+
+    @property
+    def type(self):
+        return self.netlist.type_names[self.netlist.types[self.row]]
+
+    @property
+    def function(self):
+        return self.netlist.templates[self.type].function
+
+    @property
+    def position(self):
+        return (self.netlist.xs[self.row], self.netlist.ys[self.row])
+
+    @property
+    def inputs(self):
+        n = self.netlist
+        x, y = self.position
+        start, end = n.in_start[self.row], n.in_start[self.row + 1]
+        offsets = pin_offsets(self.type, end - start, 0)[0]
+        return [TerminalView(n, n.in_net[start + i], i, "GATE_I", (x + dx, y + dy)) for i, (dx, dy) in enumerate(offsets)]
+
+    @property
+    def outputs(self):
+        n = self.netlist
+        x, y = self.position
+        gate_type = self.type
+        count = len(n.templates[gate_type].outputs)
+        offsets = pin_offsets(gate_type, 0, count)[1]
+        is_not = gate_type in ("NOT", "NAND", "NOR", "XNOR")
+        return [TerminalView(n, n.out_net[self.row] + i, i, "GATE_O", (x + dx, y + dy), is_not) for i, (dx, dy) in enumerate(offsets)]
+
+
+class WireView:
+    __slots__ = ("netlist", "k")
+
+    draw = Wire.draw
+    get_port_pos = Wire.get_port_pos
+
+    def __init__(self, netlist, k):
+        self.netlist = netlist
+        self.k = k
+
+    @property
+    def from_i(self):
+        return self.netlist.net_source(self.netlist.wire_src[self.k])
+
+    @property
+    def to_i(self):
+        n = self.netlist
+        row = n.wire_dst_row[self.k]
+        if row < 0:
+            return (n.wire_dst_pin[self.k], "TERMINAL_O", 0)
+        return (n.ids[row], "GATE_I", n.wire_dst_pin[self.k])
+
+    @property
+    def value(self):
+        return bool(self.netlist.values[self.netlist.wire_src[self.k]])
+
+    @property
+    def color(self):
+        return green if self.value else wire_color_false
+
+
+class GateViews:
+    # Read-only id -> GateView mapping, the shape of Level.gates
+    __slots__ = ("netlist",)
+
+    def __init__(self, netlist):
+        self.netlist = netlist
+
+    def __getitem__(self, gate_id):
+        return GateView(self.netlist, self.netlist.index[gate_id])
+
+    def __contains__(self, gate_id):
+        return gate_id in self.netlist.index
+
+    def __len__(self):
+        return len(self.netlist.ids)
+
+    def __iter__(self):
+        return iter(self.netlist.ids)
+
+    def values(self):
+        return (GateView(self.netlist, row) for row in range(len(self.netlist.ids)))
+
+    def items(self):
+        return ((self.netlist.ids[row], GateView(self.netlist, row)) for row in range(len(self.netlist.ids)))
+
+
+class Netlist:
+    __slots__ = ("n_inputs", "n_outputs", "templates", "type_names", "type_codes", "ids", "index", "types",
+                 "xs", "ys", "in_start", "in_net", "out_net", "net_row", "values", "output_net",
+                 "wire_src", "wire_dst_row", "wire_dst_pin", "order", "unordered", "loops")
+
+    def __init__(self, n_inputs, n_outputs, templates):
+        # templates maps a gate type to a Gate giving its pin counts and, for
+        # custom gates, its function (levels.logic_gates)
+        self.n_inputs = n_inputs
+        self.n_outputs = n_outputs
+        self.templates = templates
+        self.type_names = []
+        self.type_codes = {}
+        self.ids = array("I")
+        self.index = {}
+        self.types = array("H")
+        self.xs = array("i")
+        self.ys = array("i")
+        self.in_start = array("I", [0])
+        self.in_net = array("I")
+        self.out_net = array("I")
+        # Row owning each net, -1 for the constant and the input terminals
+        self.net_row = array("i", [-1] * (n_inputs + 1))
+        self.values = bytearray(n_inputs + 1)
+        self.output_net = array("I", [0] * n_outputs)
+        self.wire_src = array("I")
+        self.wire_dst_row = array("i")
+        self.wire_dst_pin = array("I")
+        self.order = array("I")
+        self.unordered = array("I")
+        self.loops = []
+
+    @classmethod
+    def build(cls, n_inputs, n_outputs, templates, gates, wires):
+        # gates: (id, type, (x, y)) rows; wires: (from_i, to_i) endpoint pairs
+        netlist = cls(n_inputs, n_outputs, templates)
+        for gate_id, gate_type, position in gates:
+            netlist.add_gate(gate_id, gate_type, position)
+        for from_i, to_i in wires:
+            netlist.connect(from_i, to_i)
+        netlist.levelize()
+        netlist.settle()
+        return netlist
+
+    @classmethod
+    def from_level(cls, level, templates):
+        gates = ((gate.id, gate.type, gate.position) for gate in level.gates.values())
+        wires = ((wire.from_i, wire.to_i) for wire in level.wires)
+        return cls.build(len(level.inputs), len(level.outputs), templates, gates, wires)
+
+    def add_gate(self, gate_id, gate_type, position):
+        if gate_type not in self.templates:
+            raise ValueError(f"Unknown gate type '{gate_type}'")
+        code = self.type_codes.get(gate_type)
+        if code is None:
+            code = self.type_codes[gate_type] = len(self.type_names)
+            self.type_names.append(gate_type)
+        template = self.templates[gate_type]
+        row = len(self.ids)
+        self.index[gate_id] = row
+        self.ids.append(gate_id)
+        self.types.append(code)
+        self.xs.append(int(position[0]))
+        self.ys.append(int(position[1]))
+        self.in_net.extend([0] * len(template.inputs))
+        self.in_start.append(len(self.in_net))
+        self.out_net.append(len(self.values))
+        self.net_row.extend([row] * len(template.outputs))
+        self.values.extend(bytes(len(template.outputs)))
+
+    def net_of(self, endpoint):
+        idx, kind, pin = endpoint[:3]
+        if kind == "TERMINAL_I" and 0 <= idx < self.n_inputs:
+            return idx + 1
+        elif kind == "GATE_O" and idx in self.index:
+            row = self.index[idx]
+            if 0 <= pin < len(self.templates[self.type_names[self.types[row]]].outputs):
+                return self.out_net[row] + pin
+        raise ValueError(f"Wire endpoint {tuple(endpoint)} is not a source in this netlist")
+
+    def net_source(self, net):
+        row = self.net_row[net]
+        if row < 0:
+            return (net - 1, "TERMINAL_I", 0)
+        return (self.ids[row], "GATE_O", net - self.out_net[row])
+
+    def connect(self, from_i, to_i):
+        net = self.net_of(from_i)
+        idx, kind, pin = to_i
+        if kind == "TERMINAL_O" and 0 <= idx < self.n_outputs:
+            self.output_net[idx] = net
+            row = -1
+        elif kind == "GATE_I" and idx in self.index and 0 <= pin < self.in_start[self.index[idx] + 1] - self.in_start[self.index[idx]]:
+            row = self.index[idx]
+            self.in_net[self.in_start[row] + pin] = net
+            idx = pin
+        else:
+            raise ValueError(f"Wire endpoint {tuple(to_i)} is not a sink in this netlist")
+        self.wire_src.append(net)
+        self.wire_dst_row.append(row)
+        self.wire_dst_pin.append(idx)
+
+    def levelize(self):
+        n_rows = len(self.ids)
+        successors = [[] for _ in range(n_rows)]
+        indegree = array("I", bytes(4 * n_rows))
+        net_row, in_net, in_start = self.net_row, self.in_net, self.in_start
+        for row in range(n_rows):
+            for k in range(in_start[row], in_start[row + 1]):
+                src = net_row[in_net[k]]
+                if src >= 0:
+                    successors[src].append(row)
+                    indegree[row] += 1
+        ready = deque(row for row in range(n_rows) if indegree[row] == 0)
+        order = array("I")
+        while ready:
+            row = ready.popleft()
+            order.append(row)
+            for nxt in successors[row]:
+                indegree[nxt] -= 1
+                if indegree[nxt] == 0:
+                    ready.append(nxt)
+        self.order = order
+        placed = set(order)
+        self.unordered = array("I", (row for row in range(n_rows) if row not in placed))
+        graph = {row: successors[row] for row in self.unordered}
+        self.loops = [[self.ids[row] for row in loop] for loop in find_combinational_loops(self.unordered, graph)]
+
+    def evaluate_row(self, row):
+        values, in_net, out_net = self.values, self.in_net, self.out_net
+        inputs = [values[in_net[k]] == 1 for k in range(self.in_start[row], self.in_start[row + 1])]
+        gate_type = self.type_names[self.types[row]]
+        op = builtin_ops.get(gate_type)
+        if op is not None:
+            outputs = (op(inputs),)
+        else:
+            outputs = self.templates[gate_type].function(inputs)
+        changed = False
+        base = out_net[row]
+        for i, value in enumerate(outputs):
+            value = 1 if value else 0
+            if values[base + i] != value:
+                values[base + i] = value
+                changed = True
+        return changed
+
+    def settle(self, budget=4):
+        # One sweep in topological order settles everything off the loops;
+        # gates on or behind a loop get up to budget extra sweeps
+        evaluate_row = self.evaluate_row
+        for row in self.order:
+            evaluate_row(row)
+        for _ in range(budget):
+            changed = False
+            for row in self.unordered:
+                changed |= evaluate_row(row)
+            if not changed:
+                break
+
+    def set_input(self, i, value):
+        self.values[i + 1] = 1 if value else 0
+        self.settle()
+
+    def output_values(self):
+        return [self.values[net] == 1 for net in self.output_net]
+
+    @property
+    def gates(self):
+        return GateViews(self)
+
+    @property
+    def wires(self):
+        return [WireView(self, k) for k in range(len(self.wire_src))]
+
+    def ports(self):
+        inputs = [TerminalView(self, i + 1, i, "TERMINAL_I", terminal_position("TERMINAL_I", i, FIELD)) for i in range(self.n_inputs)]
+        outputs = [TerminalView(self, net, i, "TERMINAL_O", terminal_position("TERMINAL_O", i, FIELD)) for i, net in enumerate(self.output_net)]
+        return {"TERMINAL_I": inputs, "TERMINAL_O": outputs, "GATE": self.gates}
+
+    def draw(self, screen):
+        # Same layering as Level.draw at an identity camera, straight from the
+        # buffers
+        ports = self.ports()
+        for terms in (ports["TERMINAL_I"], ports["TERMINAL_O"]):
+            for term in terms:
+                draw_terminal(screen, term)
+        blits = []
+        for gate in self.gates.values():
+            image, (dx, dy) = gate.sprite()
+            x, y = gate.position
+            blits.append((image, (x + dx, y + dy)))
+        screen.blits(blits, doreturn=False)
+        for wire in self.wires:
+            wire.draw(screen, ports)
@@ -1,4 +1,364 @@
-import pygame
+import sys
+import csv
+import time
+import threading
+import importlib.util
+from types import ModuleType
+from collections import OrderedDict, deque
+
+class MissingModule(ModuleType):
+    # Placeholder for a module that is not installed: the first attribute
+    # access raises ModuleNotFoundError instead of the import
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'", name=self.__name__)
+
+def lazy_import(name):
+    # Returns the module right away but only executes it on first attribute
+    # access, so importing the UI helpers does not load pygame. Without
+    # pygame installed the headless parts (grader, compile, evaluate) still work.
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return MissingModule(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+pygame = lazy_import("pygame")
+
+# Asset cache: every image file is read from disk once (_loaded_images, by
+# path); scaled and tinted variants are kept in an LRU keyed by
+# (path, size, tint) so steady-state frames never touch the disk.
+SCALED_IMAGE_CACHE_SIZE = 64
+_loaded_images = {}
+_converted_images = set()
+_scaled_images = OrderedDict()
+_image_lock = threading.Lock()
+
+def _load_image(path):
+    with _image_lock:
+        image = _loaded_images.get(path)
+        if image is None:
+            image = pygame.image.load(path)
+            _loaded_images[path] = image
+    # Pixel format conversion needs a display, so it happens on first use
+    # in the render thread rather than while preloading
+    if (path not in _converted_images and threading.current_thread() is threading.main_thread()
+            and pygame.display.get_surface() is not None):
+        image = image.convert_alpha()
+        _loaded_images[path] = image
+        _converted_images.add(path)
+    return image
+
+def get_image(path, size=None, tint=None):
+    key = (path, size, tint)
+    image = _scaled_images.get(key)
+    if image is not None:
+        _scaled_images.move_to_end(key)
+        return image
+
+    image = _load_image(path)
+    if size is not None:
+        image = pygame.transform.scale(image, size)
+    if tint is not None:
+        image = image.copy()
+        tint_surf = pygame.Surface(image.get_size(), pygame.SRCALPHA)
+        tint_surf.fill(tint)
+        image.blit(tint_surf, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+    _scaled_images[key] = image
+    if len(_scaled_images) > SCALED_IMAGE_CACHE_SIZE:
+        _scaled_images.popitem(last=False)
+    return image
+
+def preload_images(paths, background=True):
+    def load_all():
+        for path in paths:
+            _load_image(path)
+    if background:
+        thread = threading.Thread(target=load_all, name="preload-images", daemon=True)
+        thread.start()
+        return thread
+    load_all()
+
+def evict_scaled_images():
+    # Called after a resize: scaled variants for the old window size are
+    # dropped, the decoded originals stay in memory
+    _scaled_images.clear()
+
+# Font registry: each (name, size) is loaded once per process and shared by
+# the menus, the level screen and the gates. Rendered strings are kept in an
+# LRU keyed by (text, font, color), so labels that do not change between
+# frames are rasterized once.
+TEXT_CACHE_SIZE = 512
+_fonts = {}
+_text_cache = OrderedDict()
+
+def get_font(name, size):
+    # SysFont ignores case, so 'Arial' and 'arial' share one entry
+    key = (name.lower(), size)
+    font = _fonts.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = _fonts[key] = pygame.font.SysFont(name, size)
+    return font
+
+def prewarm_fonts(specs):
+    for name, size in specs:
+        get_font(name, size)
+
+def get_text(text, font, color=(255, 255, 255)):
+    key = (text, font, color)
+    surf = _text_cache.get(key)
+    if surf is not None:
+        _text_cache.move_to_end(key)
+        return surf
+    surf = _text_cache[key] = font.render(text, True, color)
+    if len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return surf
+
+# Dirty-rectangle bookkeeping: each frame the screen is described as
+# {key: (rect, state)}. Items that appeared, disappeared, moved or changed
+# state give the rects to repaint; a rect of None stands for something
+# that covers an unknown area and forces a full redraw when it changes.
+# Overlapping rects are merged, and each remaining one is repainted on its
+# own; past max_passes of them a single pass over their union is cheaper.
+class DirtyRegions:
+    # Every rect costs one clipped pass over the whole scene, and building the
+    # scene dominates: a 60x60 pass measured 23-34% of a full redraw (200 and
+    # 2000 gates). Past two rects a single pass over their union is cheaper.
+    def __init__(self, max_passes=2):
+        self.items = {}
+        self.full = True
+        self.max_passes = max_passes
+
+    def invalidate(self):
+        self.full = True
+
+    def collect(self, items):
+        # Returns the rects to repaint, or None for a full redraw
+        previous = self.items
+        self.items = items
+        if self.full:
+            self.full = False
+            return None
+        rects = []
+        for key, (rect, state) in items.items():
+            old = previous.pop(key, None)
+            if old is not None and old[0] == rect and old[1] == state:
+                continue
+            if rect is None or (old is not None and old[0] is None):
+                return None
+            rects.append(rect)
+            if old is not None:
+                rects.append(old[0])
+        for rect, _ in previous.values():
+            if rect is None:
+                return None
+            rects.append(rect)
+        rects = merge_rects(rects)
+        if len(rects) > self.max_passes:
+            return [rects[0].unionall(rects[1:])]
+        return rects
+
+def merge_rects(rects):
+    # Unions overlapping rects until no two overlap
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+# Frame pacing for the screen loops. While the player drags or wires the
+# loop runs at interactive_fps; animations (scrolling background, bobbing
+# buttons, a circuit still settling) run at animation_fps, capped further by
+# battery_saver_fps when battery_saver is on; anything else blocks in
+# pygame.event.wait until input arrives or idle_timeout ms pass.
+class FrameScheduler:
+    def __init__(self, interactive_fps=240, animation_fps=60, battery_saver_fps=30, idle_timeout=500):
+        self.clock = pygame.time.Clock()
+        self.interactive_fps = interactive_fps
+        self.animation_fps = animation_fps
+        self.battery_saver_fps = battery_saver_fps
+        self.battery_saver = False
+        self.idle_timeout = idle_timeout
+
+    def events(self, interactive=False, animating=False):
+        if interactive:
+            self.clock.tick(self.interactive_fps)
+            return pygame.event.get()
+        if animating:
+            fps = min(self.animation_fps, self.battery_saver_fps) if self.battery_saver else self.animation_fps
+            self.clock.tick(fps)
+            return pygame.event.get()
+        event = pygame.event.wait(self.idle_timeout)
+        events = [] if event.type == pygame.NOEVENT else [event]
+        events.extend(pygame.event.get())
+        # Keeps the clock's frame time meaningful after a long wait
+        self.clock.tick()
+        return events
+
+# Pan and zoom of the play area: screen = (world - origin) * zoom. Zoom
+# moves in powers of ZOOM_STEP so scaled sprites can be cached per step.
+class Camera:
+    ZOOM_STEP = 1.25
+    MIN_STEP, MAX_STEP = -10, 6
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.step = 0
+        self.zoom = 1.0
+
+    def state(self):
+        return (self.x, self.y, self.step)
+
+    def to_screen(self, pos):
+        return (round((pos[0] - self.x) * self.zoom), round((pos[1] - self.y) * self.zoom))
+
+    def to_world(self, pos):
+        return (round(pos[0] / self.zoom + self.x), round(pos[1] / self.zoom + self.y))
+
+    def rect_to_screen(self, rect):
+        left, top = self.to_screen(rect.topleft)
+        right, bottom = self.to_screen(rect.bottomright)
+        return pygame.Rect(left, top, right - left, bottom - top).inflate(2, 2)
+
+    def viewport(self, width, height, margin=0):
+        # World rect on screen, grown by margin world units on every side
+        left, top = int(self.x) - 1 - margin, int(self.y) - 1 - margin
+        return pygame.Rect(left, top, int(width / self.zoom) + 3 + 2 * margin, int(height / self.zoom) + 3 + 2 * margin)
+
+    def pan(self, dx, dy):
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+
+    def zoom_at(self, pos, steps):
+        # Keeps the world point under pos in place
+        wx, wy = pos[0] / self.zoom + self.x, pos[1] / self.zoom + self.y
+        self.step = max(self.MIN_STEP, min(self.MAX_STEP, self.step + steps))
+        self.zoom = self.ZOOM_STEP ** self.step
+        self.x = wx - pos[0] / self.zoom
+        self.y = wy - pos[1] / self.zoom
+
+# Frame-phase timings for play_level. The loop calls frame() once per
+# iteration and lap(phase) after each step, which charges the time since the
+# previous lap to that phase; whatever runs between the last lap and the next
+# frame() is the event handling. Disabled, every call returns right away.
+class FrameProfiler:
+    PHASES = ("gate_update", "dirty_rects", "background", "palette", "instructions", "gate_draw",
+              "wire_update", "wire_draw", "ui", "flip", "wait", "events")
+    FPS_BINS = (15, 30, 45, 60, 90, 120, 240)
+
+    def __init__(self, window=120, history=10000):
+        self.enabled = False
+        self.window = window
+        # (interval since the previous frame, {phase: ms}) per frame, in ms
+        self.samples = deque(maxlen=history)
+        self.frames = 0
+        self.current = {}
+        self.frame_start = None
+        self.mark = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.samples.clear()
+        self.current = {}
+        self.frame_start = self.mark = None
+
+    def lap(self, phase):
+        if self.enabled and self.mark is not None:
+            now = time.perf_counter()
+            self.current[phase] = self.current.get(phase, 0.0) + (now - self.mark) * 1000
+            self.mark = now
+
+    def frame(self):
+        if not self.enabled:
+            return
+        self.lap("events")
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.samples.append(((now - self.frame_start) * 1000, self.current))
+            self.frames += 1
+        self.frame_start = self.mark = now
+        self.current = {}
+
+    def stats(self):
+        recent = list(self.samples)[-self.window:]
+        if not recent:
+            return None
+        averages = {phase: sum(phases.get(phase, 0.0) for _, phases in recent) / len(recent) for phase in self.PHASES}
+        # Frame time is the work done, without the scheduler's sleep
+        work = sorted(sum(phases.values()) - phases.get("wait", 0.0) for _, phases in recent)
+        percentile = lambda p: work[min(len(work) - 1, int(p / 100 * len(work)))]
+        histogram = [0] * (len(self.FPS_BINS) + 1)
+        for interval, _ in recent:
+            fps = 1000 / interval if interval > 0 else float("inf")
+            histogram[sum(fps >= edge for edge in self.FPS_BINS)] += 1
+        fps = 1000 * len(recent) / sum(interval for interval, _ in recent)
+        return {"averages": averages, "p50": percentile(50), "p95": percentile(95), "p99": percentile(99),
+                "fps": fps, "histogram": histogram}
+
+    def dump_csv(self, path):
+        extra = sorted({phase for _, phases in self.samples for phase in phases} - set(self.PHASES))
+        columns = list(self.PHASES) + extra
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "interval_ms", "work_ms"] + [f"{phase}_ms" for phase in columns])
+            for i, (interval, phases) in enumerate(self.samples):
+                work = sum(phases.values()) - phases.get("wait", 0.0)
+                writer.writerow([i, f"{interval:.3f}", f"{work:.3f}"] + [f"{phases.get(phase, 0.0):.3f}" for phase in columns])
+
+    def overlay_rect(self, pos):
+        return pygame.Rect(pos[0], pos[1], 230, 16 * (len(self.PHASES) + 3) + 58)
+
+    def draw(self, screen, pos):
+        rect = self.overlay_rect(pos)
+        panel = pygame.Surface(rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+        font = get_font('arial', 14)
+        stats = self.stats()
+        # Numbers change every frame, so they are rendered directly rather
+        # than through the text cache
+        if stats is None:
+            lines = ["Coletando amostras..."]
+        else:
+            lines = [f"FPS {stats['fps']:.0f}",
+                     f"Quadro p50 {stats['p50']:.1f}  p95 {stats['p95']:.1f}  p99 {stats['p99']:.1f} ms",
+                     ""]
+            lines += [f"{phase}: {stats['averages'][phase]:.2f} ms" for phase in self.PHASES]
+        for i, line in enumerate(lines):
+            panel.blit(font.render(line, True, (255, 255, 255)), (8, 4 + 16 * i))
+
+        if stats is not None:
+            # FPS histogram, one bar per bin, lowest rates on the left
+            histogram = stats["histogram"]
+            top = rect.height - 54
+            bar_w = (rect.width - 16) // len(histogram)
+            tallest = max(histogram) or 1
+            for i, count in enumerate(histogram):
+                h = round(36 * count / tallest)
+                pygame.draw.rect(panel, (80, 200, 120), (8 + i * bar_w, top + 36 - h, bar_w - 2, h))
+            labels = ("<15",) + tuple(str(edge) for edge in self.FPS_BINS)
+            small = get_font('arial', 10)
+            for i, label in enumerate(labels):
+                panel.blit(get_text(label, small), (8 + i * bar_w, top + 38))
+        screen.blit(panel, rect)
+        return rect
+
+profiler = FrameProfiler()
 
 class Button:
     def __init__(self, text, font, x, y, padding, background_color, hover_color):
@@ -7,26 +367,37 @@ class Button:
         self.padding = padding
         self.background_color = background_color
         self.hover_color = hover_color
+        # Pre-rendered visual states keyed by (size, background, border color)
+        self.states = {}
         self.render_text()
         self.rect = self.text_surf.get_rect(center=(x, y))
         self.rect.inflate_ip(self.padding, self.padding)
 
     def render_text(self, color=(255, 255, 255)):
         self.text_surf = self.font.render(self.text, True, color)
+        self.states.clear()
 
-    def draw(self, surface, is_selected, border_sel, dark_bg, offset=(0, 0)):
-        bg_color = self.hover_color if is_selected else self.background_color
-        rect = self.rect.move(offset)
+    def set_text(self, text):
+        if text == self.text:
+            return
+        center = self.rect.center
+        self.text = text
+        self.render_text()
+        self.rect = self.text_surf.get_rect(center=center)
+        self.rect.inflate_ip(self.padding, self.padding)
+
+    def render_state(self, bg_color, border_col):
+        # Everything a state draws, composed once onto one surface whose
+        # origin is the button's top-left corner (the shadow spills 4px out)
+        rect = pygame.Rect((0, 0), self.rect.size)
+        shadow_offset = (4, 4)
+        surf = pygame.Surface((rect.width + shadow_offset[0], rect.height + shadow_offset[1]), pygame.SRCALPHA)
 
         # Use rounded corners always
         border_radius = min(rect.width, rect.height) // 2  # Make it as round as possible
 
         # Draw a shadow for depth
-        shadow_offset = (4, 4)
-        shadow_rect = rect.move(shadow_offset)
-        shadow_surf = pygame.Surface(shadow_rect.size, pygame.SRCALPHA)
-        pygame.draw.rect(shadow_surf, (30, 30, 30, 120), shadow_surf.get_rect(), border_radius=border_radius)
-        surface.blit(shadow_surf, shadow_rect.topleft)
+        pygame.draw.rect(surf, (30, 30, 30, 120), rect.move(shadow_offset), border_radius=border_radius)
 
         # Draw gradient background with rounded corners
         gradient_surf = pygame.Surface(rect.size, pygame.SRCALPHA)
@@ -36,65 +407,97 @@ class Button:
             g = int(bg_color[1] * (1 - y / rect.height) + 40 * (y / rect.height))
             b = int(bg_color[2] * (1 - y / rect.height) + 40 * (y / rect.height))
             pygame.draw.line(gradient_surf, (r, g, b, alpha), (0, y), (rect.width, y))
-        
+
         # Mask the gradient with a rounded rectangle
         mask = pygame.Surface(rect.size, pygame.SRCALPHA)
         pygame.draw.rect(mask, (255, 255, 255, 255), mask.get_rect(), border_radius=border_radius)
         gradient_surf.blit(mask, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
-        surface.blit(gradient_surf, rect.topleft)
+        surf.blit(gradient_surf, (0, 0))
 
         # Draw border with a thicker, rounded look
-        border_col = border_sel if is_selected else dark_bg
-        pygame.draw.rect(surface, border_col, rect, width=5, border_radius=border_radius)
+        pygame.draw.rect(surf, border_col, rect, width=5, border_radius=border_radius)
 
         # Draw the text with a slight shadow
         text_rect = self.text_surf.get_rect(center=rect.center)
         shadow_offset = (1, 2)
         shadow_pos = (text_rect.x + shadow_offset[0], text_rect.y + shadow_offset[1])
         shadow_surf = self.font.render(self.text, True, (0, 0, 0))
-        surface.blit(shadow_surf, shadow_pos)
-        surface.blit(self.text_surf, text_rect)
+        surf.blit(shadow_surf, shadow_pos)
+        surf.blit(self.text_surf, text_rect)
+        return surf
+
+    def draw(self, surface, is_selected, border_sel, dark_bg, offset=(0, 0)):
+        bg_color = self.hover_color if is_selected else self.background_color
+        border_col = border_sel if is_selected else dark_bg
+        key = (self.rect.size, tuple(bg_color), tuple(border_col))
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = self.render_state(bg_color, border_col)
+        surface.blit(state, self.rect.move(offset).topleft)
 
     def is_mouse_over(self, pos):
         return self.rect.collidepoint(pos)
 
 def draw_text(screen, text, pos, font, color=(255, 255, 255)):
-    txt = font.render(text, True, color)
+    txt = get_text(text, font, color)
     screen.blit(txt, (int(pos[0]), int(pos[1])))
 
-def draw_background(screen, color, pattern_offset=0):
+# Pre-rendered backgrounds keyed by (size, color). The gradient only varies
+# vertically, so the gradient and the diagonal pattern are composed once onto
+# a surface two pattern periods wider than the window (one to scroll, one so
+# lines are not clipped at its left edge), and the animation is a horizontal
+# offset into it.
+_background_cache = {}
+PATTERN_SPACING = 32
+
+def _render_background(width, height, color):
+    spacing = PATTERN_SPACING
+    strip_width = width + 2 * spacing
+    surf = pygame.Surface((strip_width, height))
     # Fill with a vertical gradient from color to a darker shade
-    width, height = screen.get_size()
     for y in range(height):
         # Interpolate between the base color and a darker version
         factor = y / height
         r = int(color[0] * (1 - factor) + (color[0] // 2) * factor)
         g = int(color[1] * (1 - factor) + (color[1] // 2) * factor)
         b = int(color[2] * (1 - factor) + (color[2] // 2) * factor)
-        pygame.draw.line(screen, (r, g, b), (0, y), (width, y))
+        pygame.draw.line(surf, (r, g, b), (0, y), (strip_width, y))
 
     # Overlay a subtle diagonal pattern for texture
     pattern_color = (255, 255, 255, 18)  # Low alpha for subtlety
-    pattern_surf = pygame.Surface((width, height), pygame.SRCALPHA)
-    spacing = 32
+    pattern_surf = pygame.Surface((strip_width, height), pygame.SRCALPHA)
+    for x in range(-height, strip_width, spacing):
+        pygame.draw.line(pattern_surf, pattern_color, (x, 0), (x + height, height), 2)
+    surf.blit(pattern_surf, (0, 0))
+
+    if pygame.display.get_surface() is not None:
+        surf = surf.convert()
+    return surf
+
+def draw_background(screen, color, pattern_offset=0):
+    width, height = screen.get_size()
+    key = ((width, height), tuple(color))
+    surf = _background_cache.get(key)
+    if surf is None:
+        # Only the current window size is worth keeping
+        _background_cache.clear()
+        surf = _background_cache[key] = _render_background(width, height, color)
     # Move the pattern by pattern_offset (wraps around spacing)
-    offset = int(pattern_offset) % spacing
-    for x in range(-height, width, spacing):
-        pygame.draw.line(pattern_surf, pattern_color, (x + offset, 0), (x + height + offset, height), 2)
-    screen.blit(pattern_surf, (0, 0))
+    offset = int(pattern_offset) % PATTERN_SPACING
+    screen.blit(surf, (offset - 2 * PATTERN_SPACING, 0))
 
 def draw_success_message(screen, width, height, font, color):
     backboard_rect = pygame.Rect(width // 4, height // 2 - height // 8, width - width // 2, height // 4)
     pygame.draw.rect(screen, (30, 30, 30), backboard_rect, border_radius=20)
     pygame.draw.rect(screen, (60, 60, 60), backboard_rect, 4, border_radius=20)
-    success_text = font.render("Nível Completo!", True, color)
+    success_text = get_text("Nível Completo!", font, color)
     screen.blit(success_text, success_text.get_rect(center=(width // 2, height // 2)))
 
 def draw_failure_message(screen, width, height, font, color):
     backboard_rect = pygame.Rect(width // 4, height // 2 - height // 8, width - width // 2, height // 4)
     pygame.draw.rect(screen, (30, 30, 30), backboard_rect, border_radius=20)
     pygame.draw.rect(screen, (60, 60, 60), backboard_rect, 4, border_radius=20)
-    failure_text = font.render("Nível Falhado!", True, color)
+    failure_text = get_text("Nível Falhado!", font, color)
     screen.blit(failure_text, failure_text.get_rect(center=(width // 2, height // 2)))
 
 def draw_run_button(screen, pos, color, button_size=56, hover=True):
@@ -210,14 +613,9 @@ def draw_reset_button(screen, pos, color, button_size=56, hover=True, image=""):
     pygame.draw.rect(screen, bg_color, rect, border_radius=14)
     pygame.draw.rect(screen, border_color, rect, 4, border_radius=14)
 
-    # Load and draw the reset icon (images/reset.png), scale to fit
-    reset_img = pygame.image.load(image).convert_alpha()
+    # Draw the reset icon (images/reset.png), scaled to fit and tinted
     icon_size = int(button_size * 0.6)
-    reset_img = pygame.transform.scale(reset_img, (icon_size, icon_size))
-    # Tint the icon
-    tint_surf = pygame.Surface((icon_size, icon_size), pygame.SRCALPHA)
-    tint_surf.fill(icon_color)
-    reset_img.blit(tint_surf, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+    reset_img = get_image(image, (icon_size, icon_size), icon_color)
     icon_x = rect.x + (button_size - icon_size) // 2
     icon_y = rect.y + (button_size - icon_size) // 2
-    screen.blit(reset_img, (icon_x, icon_y))
\ No newline at end of file
+    screen.blit(reset_img, (icon_x, icon_y))